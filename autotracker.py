@@ -32,13 +32,33 @@ import bpy
 import bgl
 import blf
 import math
+import concurrent.futures
+import collections
+import contextlib
+import cProfile
+import heapq
+import json
+import os
+import queue
+import re
+import shutil
+import struct
+import tempfile
+import threading
+import zlib
+import numpy as np
 from mathutils import Vector
 from bpy.types import Operator, Panel, PropertyGroup, WindowManager
-from bpy.props import BoolProperty, FloatProperty, IntProperty, EnumProperty, PointerProperty
+from bpy.props import BoolProperty, FloatProperty, IntProperty, EnumProperty, PointerProperty, StringProperty
+from bpy_extras.io_utils import ExportHelper, ImportHelper
 
 # for debug purpose
 import time
 
+# approximate size of MovieTrackingTrack and MovieTrackingMarker structs, to report memory reclaimed
+TRACK_BYTES = 224
+MARKER_BYTES = 64
+
 # http://blenderscripting.blogspot.ch/2011/07/bgl-drawing-with-opengl-onto-blender-25.html
 class GlDrawOnScreen():
     black = (0.0, 0.0, 0.0, 0.7)
@@ -98,292 +118,2448 @@ class GlDrawOnScreen():
         self.Polygon([(xs, y), (xs, y1), (xi, y1), (xi, y)], self.progress_colour)
         self.Rectangle(x, y, x1, y1, self.white, width=1)
         
+class SpatialGrid():
+    """
+        Uniform grid over marker coordinates
+        cell size is the search radius so a query only visits the 3x3 surrounding cells
+    """
+    def __init__(self, radius):
+        self.radius = radius
+        self.cells = {}
+    def cell(self, co):
+        return (int(math.floor(co[0]/self.radius)), int(math.floor(co[1]/self.radius)))
+    def insert(self, co, item=None):
+        self.cells.setdefault(self.cell(co), []).append((co[0], co[1], item))
+    def find_near(self, co):
+        """
+            return (x, y, item) of first point closer than radius or None
+        """
+        cx, cy = self.cell(co)
+        r2 = self.radius*self.radius
+        for i in range(cx-1, cx+2):
+            for j in range(cy-1, cy+2):
+                for pt in self.cells.get((i, j), ()):
+                    dx = pt[0]-co[0]
+                    dy = pt[1]-co[1]
+                    if dx*dx+dy*dy < r2:
+                        return pt
+        return None
+    def __len__(self):
+        return sum(len(pts) for pts in self.cells.values())
+        
+class FrameIndex():
+    """
+        frame -> marker index lookup of a sorted frames array, by binary search
+        so nothing is built per track
+    """
+    __slots__ = ("frames",)
+    def __init__(self, frames):
+        self.frames = frames
+    def get(self, frame, default=None):
+        i = int(np.searchsorted(self.frames, frame))
+        if i < len(self.frames) and self.frames[i] == frame:
+            return i
+        return default
+    def __getitem__(self, frame):
+        i = self.get(frame)
+        if i is None:
+            raise KeyError(frame)
+        return i
+    def __contains__(self, frame):
+        return self.get(frame) is not None
+        
+class TrackStore():
+    """
+        Track data used by the autotrack algorithms, tracks are opaque handles
+        RnaTrackStore reads and writes clip tracks, ArrayTrackStore keeps them in arrays (headless)
+        markers of a track are sorted by frame, positions are normalized
+        read arrays may be cached until invalidate, they must not be modified
+    """
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+    def tracks(self):
+        """
+            return tracks in clip order, new tracks are added at the end
+        """
+        raise NotImplementedError
+    def key(self, track):
+        """
+            return a hashable id, unique among current tracks
+        """
+        raise NotImplementedError
+    def frames(self, track):
+        """
+            return marker frames array and frame -> index FrameIndex of track
+        """
+        raise NotImplementedError
+    def co(self, track):
+        """
+            return (markers x 2) positions array of track
+        """
+        raise NotImplementedError
+    def mute(self, track, index=None):
+        """
+            return mute array of track markers, or mute of marker at index
+        """
+        raise NotImplementedError
+    def find(self, track, frame):
+        """
+            return index of track marker at frame or None
+        """
+        return self.frames(track)[1].get(frame)
+    def name(self, track):
+        """
+            return track name, unique among current tracks
+        """
+        raise NotImplementedError
+    def hidden(self, track):
+        raise NotImplementedError
+    def locked(self, track):
+        raise NotImplementedError
+    def selected(self, track):
+        raise NotImplementedError
+    def set_hidden(self, track, hide):
+        raise NotImplementedError
+    def select(self, track, select=True):
+        raise NotImplementedError
+    def deselect_all(self):
+        raise NotImplementedError
+    def set_frames_limit(self, track, limit):
+        raise NotImplementedError
+    def new_track(self, frame, co=None):
+        """
+            return a new selected track with one marker at frame, at co or (0, 0)
+        """
+        raise NotImplementedError
+    def insert_markers(self, track, frames, co, mute=None):
+        """
+            add or replace markers, unmuted when mute is None
+        """
+        raise NotImplementedError
+    def delete_markers(self, track, frames):
+        raise NotImplementedError
+    def set_mute(self, track, frame, mute=True):
+        raise NotImplementedError
+    def set_co(self, track, co):
+        """
+            replace positions of all track markers, co : (markers x 2) array
+        """
+        raise NotImplementedError
+    def remove(self, tracks):
+        raise NotImplementedError
+    def arrays(self, tracks):
+        """
+            return TrackArrays copy of tracks
+        """
+        raise NotImplementedError
+    def add_arrays(self, arrays):
+        """
+            create tracks from TrackArrays, return created tracks
+        """
+        raise NotImplementedError
+    def invalidate(self, track=None):
+        pass
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        
+class RnaTrackStore(TrackStore):
+    """
+        clip tracks, markers arrays are read in bulk on first use and cached per track
+        must be invalidated whenever tracks are changed outside of the store
+        (after track_markers), frames of invalidated tracks are then extended
+        with the markers tracking added on either end instead of read again
+        backend : selection and deletion run through its operators
+    """
+    def __init__(self, clip, backend):
+        TrackStore.__init__(self)
+        self.clip = clip
+        self.backend = backend
+        # pointer -> [frames, FrameIndex, co, mute, generation], co and mute are read when needed
+        self.entries = {}
+        # bumped by invalidate(), entries of older generations are checked before use
+        self.generation = 0
+    def read_frames(self, track):
+        n = len(track.markers)
+        frames = np.empty(n, dtype=np.int32)
+        track.markers.foreach_get("frame", frames)
+        return frames
+    def extend_frames(self, track, frames):
+        """
+            return frames of track, reading only markers added before first or after last
+            of frames, None when markers changed otherwise
+        """
+        markers = track.markers
+        n = len(markers)
+        old = len(frames)
+        if n < old or old == 0:
+            return None
+        first = markers[0].frame
+        if first == frames[0]:
+            # added after last frame, or nothing added
+            if markers[old-1].frame != frames[-1]:
+                return None
+            added = [markers[i].frame for i in range(old, n)]
+            if len(added) == 0:
+                return frames
+            return np.concatenate((frames, np.array(added, dtype=np.int32)))
+        if markers[n-old].frame != frames[0] or markers[n-1].frame != frames[-1]:
+            return None
+        added = [markers[i].frame for i in range(n-old)]
+        return np.concatenate((np.array(added, dtype=np.int32), frames))
+    def entry(self, track):
+        key = track.as_pointer()
+        entry = self.entries.get(key)
+        if entry is not None and entry[4] != self.generation:
+            frames = self.extend_frames(track, entry[0])
+            if frames is None:
+                entry = None
+            else:
+                self.hits += 1
+                entry[:] = [frames, FrameIndex(frames), None, None, self.generation]
+                return entry
+        if entry is None:
+            self.misses += 1
+            frames = self.read_frames(track)
+            entry = [frames, FrameIndex(frames), None, None, self.generation]
+            self.entries[key] = entry
+        else:
+            self.hits += 1
+        return entry
+    def tracks(self):
+        return self.clip.tracking.tracks
+    def key(self, track):
+        return track.as_pointer()
+    def frames(self, track):
+        entry = self.entry(track)
+        return entry[0], entry[1]
+    def co(self, track):
+        entry = self.entry(track)
+        if entry[2] is None:
+            co = np.empty(2*len(entry[0]), dtype=np.float32)
+            track.markers.foreach_get("co", co)
+            entry[2] = co.reshape(len(entry[0]), 2)
+        return entry[2]
+    def mute(self, track, index=None):
+        entry = self.entry(track)
+        if entry[3] is None:
+            # a few markers are cheaper one by one
+            if index is not None:
+                return track.markers[index].mute
+            mute = np.empty(len(entry[0]), dtype=bool)
+            track.markers.foreach_get("mute", mute)
+            entry[3] = mute
+        if index is None:
+            return entry[3]
+        return bool(entry[3][index])
+    def name(self, track):
+        return track.name
+    def hidden(self, track):
+        return track.hide
+    def locked(self, track):
+        return track.lock
+    def selected(self, track):
+        return track.select
+    def set_hidden(self, track, hide):
+        track.hide = hide
+    def select(self, track, select=True):
+        track.select = select
+    def deselect_all(self):
+        self.backend.select_all(action='DESELECT')
+    def set_frames_limit(self, track, limit):
+        track.frames_limit = limit
+    def new_track(self, frame, co=None):
+        track = self.clip.tracking.tracks.new(frame=frame)
+        if co is not None:
+            track.markers.find_frame(frame).co = co
+        return track
+    def insert_markers(self, track, frames, co, mute=None):
+        # markers API has no bulk insert
+        for i, frame in enumerate(frames):
+            marker = track.markers.insert_frame(frame, co=co[i])
+            if mute is not None:
+                marker.mute = mute[i]
+        # markers are usually added on track ends, extend frames on next use
+        entry = self.entries.get(track.as_pointer())
+        if entry is not None:
+            entry[4] = None
+    def delete_markers(self, track, frames):
+        for frame in frames:
+            track.markers.delete_frame(frame)
+        self.invalidate(track)
+    def set_mute(self, track, frame, mute=True):
+        track.markers.find_frame(frame).mute = mute
+        entry = self.entries.get(track.as_pointer())
+        if entry is not None and entry[3] is not None:
+            entry[3][entry[1][frame]] = mute
+    def set_co(self, track, co):
+        co = np.ascontiguousarray(co, dtype=np.float32)
+        track.markers.foreach_set("co", co.reshape(-1))
+        entry = self.entries.get(track.as_pointer())
+        if entry is not None:
+            entry[2] = co
+    def remove(self, tracks):
+        # deleted tracks pointers may be reused by new tracks
+        for track in tracks:
+            self.entries.pop(track.as_pointer(), None)
+        self.backend.delete_tracks(tracks)
+    def arrays(self, tracks):
+        return TrackArrays.from_tracks(tracks)
+    def add_arrays(self, arrays):
+        return arrays.to_tracks(self.clip)
+    def invalidate(self, track=None):
+        if track is None:
+            self.generation += 1
+        else:
+            self.entries.pop(track.as_pointer(), None)
+    
+class TrackRecord():
+    """
+        track of an ArrayTrackStore
+        frames (int32), co (float32, markers x 2) and mute (bool) arrays sorted by frame
+    """
+    __slots__ = ("key", "name", "frames", "co", "mute", "hide", "lock", "select", "frames_limit")
+    def __init__(self, key, name, frames, co, mute):
+        self.key = key
+        self.name = name
+        self.frames = frames
+        self.co = co
+        self.mute = mute
+        self.hide = False
+        self.lock = False
+        self.select = True
+        self.frames_limit = 0
+        
+class ArrayTrackStore(TrackStore):
+    """
+        tracks kept in TrackRecord arrays, without bpy
+        to run the autotrack algorithms headless, see TrackArrays to exchange tracks with a clip
+    """
+    def __init__(self):
+        TrackStore.__init__(self)
+        self.records = []
+        # key -> FrameIndex
+        self.indices = {}
+        self.next_key = 0
+    @classmethod
+    def from_arrays(cls, arrays):
+        store = cls()
+        store.add_arrays(arrays)
+        return store
+    def add_record(self, name, frames, co, mute):
+        record = TrackRecord(self.next_key, name, frames, co, mute)
+        self.next_key += 1
+        self.records.append(record)
+        return record
+    def tracks(self):
+        return self.records
+    def key(self, track):
+        return track.key
+    def frames(self, track):
+        index = self.indices.get(track.key)
+        if index is None or index.frames is not track.frames:
+            self.misses += 1
+            index = FrameIndex(track.frames)
+            self.indices[track.key] = index
+        else:
+            self.hits += 1
+        return track.frames, index
+    def co(self, track):
+        return track.co
+    def mute(self, track, index=None):
+        if index is None:
+            return track.mute
+        return bool(track.mute[index])
+    def name(self, track):
+        return track.name
+    def hidden(self, track):
+        return track.hide
+    def locked(self, track):
+        return track.lock
+    def selected(self, track):
+        return track.select
+    def set_hidden(self, track, hide):
+        track.hide = hide
+    def select(self, track, select=True):
+        track.select = select
+    def deselect_all(self):
+        for record in self.records:
+            record.select = False
+    def set_frames_limit(self, track, limit):
+        track.frames_limit = limit
+    def new_track(self, frame, co=None):
+        if co is None:
+            co = (0.0, 0.0)
+        return self.add_record("Track.%03d" % (self.next_key), np.array([frame], dtype=np.int32),
+            np.array([co], dtype=np.float32), np.zeros(1, dtype=bool))
+    def insert_markers(self, track, frames, co, mute=None):
+        frames = np.asarray(frames, dtype=np.int32)
+        co = np.asarray(co, dtype=np.float32).reshape(-1, 2)
+        if mute is None:
+            mute = np.zeros(len(frames), dtype=bool)
+        # new markers replace the ones on the same frames
+        keep = ~np.isin(track.frames, frames)
+        all_frames = np.concatenate((track.frames[keep], frames))
+        order = np.argsort(all_frames, kind="mergesort")
+        track.frames = all_frames[order]
+        track.co = np.concatenate((track.co[keep], co))[order]
+        track.mute = np.concatenate((track.mute[keep], np.asarray(mute, dtype=bool)))[order]
+        self.invalidate(track)
+    def delete_markers(self, track, frames):
+        keep = ~np.isin(track.frames, np.asarray(frames, dtype=np.int32))
+        track.frames = track.frames[keep]
+        track.co = track.co[keep]
+        track.mute = track.mute[keep]
+        self.invalidate(track)
+    def set_mute(self, track, frame, mute=True):
+        track.mute[self.frames(track)[1][frame]] = mute
+    def set_co(self, track, co):
+        track.co = np.array(co, dtype=np.float32).reshape(-1, 2)
+    def remove(self, tracks):
+        keys = set(track.key for track in tracks)
+        self.records = [record for record in self.records if record.key not in keys]
+        for key in keys:
+            self.indices.pop(key, None)
+    def arrays(self, tracks):
+        tracks = list(tracks)
+        offsets = np.zeros(len(tracks)+1, dtype=np.int64)
+        np.cumsum([len(track.frames) for track in tracks], out=offsets[1:])
+        if len(tracks) > 0:
+            frames = np.concatenate([track.frames for track in tracks])
+            co = np.concatenate([track.co for track in tracks])
+            mute = np.concatenate([track.mute for track in tracks])
+        else:
+            frames = np.empty(0, dtype=np.int32)
+            co = np.empty((0, 2), dtype=np.float32)
+            mute = np.empty(0, dtype=bool)
+        names = np.array([track.name for track in tracks], dtype=np.str_)
+        hide = np.array([track.hide for track in tracks], dtype=bool)
+        return TrackArrays(names, hide, offsets, frames, co, mute)
+    def add_arrays(self, arrays):
+        created = []
+        for i in range(len(arrays)):
+            frames, co, mute = arrays.markers(i)
+            if len(frames) == 0:
+                continue
+            order = np.argsort(frames, kind="mergesort")
+            record = self.add_record(str(arrays.names[i]), frames[order].astype(np.int32),
+                co[order].astype(np.float32), mute[order].astype(bool))
+            record.hide = bool(arrays.hide[i])
+            record.select = False
+            created.append(record)
+        return created
+    def invalidate(self, track=None):
+        if track is None:
+            self.indices.clear()
+        else:
+            self.indices.pop(track.key, None)
+        
+class TrackSummaries():
+    """
+        first / last unmuted marker frame per track, updated incrementally
+        from the markers added on both ends of a track since last update
+        must be invalidated when markers are muted or removed inside a track
+    """
+    def __init__(self, store):
+        self.store = store
+        self.summaries = {}
+    def get(self, track):
+        """
+            return [first frame, last frame, first unmuted frame, last unmuted frame]
+            unmuted frames are None when all markers are muted
+        """
+        store = self.store
+        key = store.key(track)
+        frames = store.frames(track)[0]
+        summary = self.summaries.get(key)
+        if summary is None:
+            unmuted = frames[~store.mute(track)].tolist()
+            added = []
+        else:
+            # only read markers added before first and after last frame
+            head = int(np.searchsorted(frames, summary[0]))
+            tail = int(np.searchsorted(frames, summary[1], side='right'))
+            added = list(range(head))+list(range(tail, len(frames)))
+            unmuted = [int(frames[i]) for i in added if not store.mute(track, i)]
+            for frame in summary[2:]:
+                if frame is not None:
+                    unmuted.append(frame)
+        if summary is None or len(added) > 0:
+            if len(unmuted) > 0:
+                summary = [int(frames[0]), int(frames[-1]), min(unmuted), max(unmuted)]
+            else:
+                summary = [int(frames[0]), int(frames[-1]), None, None]
+            self.summaries[key] = summary
+        return summary
+    def invalidate(self, track):
+        self.summaries.pop(self.store.key(track), None)
+        
+class FrameCache():
+    """
+        LRU cache of decoded frames, sized in MB, with optional background prefetch
+        load : callable(frame) returning pixels array or None
+        size_mb : memory budget, least recently used frames are dropped over it
+        mmap_dir : keep frames in memory mapped raw files in a subdirectory of this directory,
+                   one per cache so parallel runs do not share files, empty for memory
+        dtype : storage type, float32 or uint8 (4 times smaller, pixels in [0, 1])
+        threaded : load prefetched frames on a background thread,
+                   only for loaders not using bpy (bpy is not thread safe)
+    """
+    def __init__(self, load, size_mb=1024, mmap_dir="", dtype=np.float32, threaded=False):
+        self.load = load
+        self.size = size_mb*1024*1024
+        self.mmap_dir = ""
+        if mmap_dir:
+            os.makedirs(mmap_dir, exist_ok=True)
+            self.mmap_dir = tempfile.mkdtemp(prefix="autotrack_frames_", dir=mmap_dir)
+        self.dtype = np.dtype(dtype)
+        self.frames = collections.OrderedDict()
+        self.used = 0
+        self.hits = 0
+        self.misses = 0
+        self.pending = set()
+        self.condition = threading.Condition()
+        self.queue = None
+        if threaded:
+            self.queue = queue.Queue()
+            self.thread = threading.Thread(target=self.worker, daemon=True)
+            self.thread.start()
+        
+    def store(self, frame, pixels):
+        # called with condition held
+        if pixels is not None:
+            if self.dtype == np.uint8:
+                pixels = (np.clip(pixels, 0, 1)*255+0.5).astype(np.uint8)
+            else:
+                pixels = pixels.astype(self.dtype, copy=False)
+            if self.mmap_dir:
+                data = np.memmap(os.path.join(self.mmap_dir, "frame_%06d.raw" % (frame)),
+                    dtype=self.dtype, mode='w+', shape=pixels.shape)
+                data[:] = pixels
+                pixels = data
+            self.used += pixels.nbytes
+        self.frames[frame] = pixels
+        while self.used > self.size and len(self.frames) > 1:
+            self.drop(next(iter(self.frames)))
+            
+    def drop(self, frame):
+        pixels = self.frames.pop(frame)
+        if pixels is not None:
+            self.used -= pixels.nbytes
+            if isinstance(pixels, np.memmap):
+                filename = pixels.filename
+                del pixels
+                os.remove(filename)
+        
+    def get(self, frame):
+        """
+            pixels of frame as float32, waiting for it when it is being prefetched
+        """
+        with self.condition:
+            while frame in self.pending:
+                self.condition.wait()
+            found = frame in self.frames
+            if found:
+                self.hits += 1
+                self.frames.move_to_end(frame)
+                pixels = self.frames[frame]
+        if not found:
+            self.misses += 1
+            pixels = self.load(frame)
+            with self.condition:
+                self.store(frame, pixels)
+                pixels = self.frames.get(frame)
+        if pixels is None:
+            return None
+        if self.dtype == np.uint8:
+            return pixels.astype(np.float32)/255.0
+        return np.asarray(pixels, dtype=np.float32)
+        
+    def prefetch(self, frames):
+        """
+            load frames in background, does nothing when not threaded
+        """
+        if self.queue is None:
+            return
+        with self.condition:
+            for frame in frames:
+                if frame not in self.frames and frame not in self.pending:
+                    self.pending.add(frame)
+                    self.queue.put(frame)
+                    
+    def worker(self):
+        while True:
+            frame = self.queue.get()
+            if frame is None:
+                break
+            try:
+                pixels = self.load(frame)
+            except Exception as e:
+                print("FrameCache: could not load frame %s: %s" % (frame, e))
+                pixels = None
+            with self.condition:
+                self.store(frame, pixels)
+                self.pending.discard(frame)
+                self.condition.notify_all()
+                
+    def hit_rate(self):
+        if self.hits+self.misses == 0:
+            return 0.0
+        return float(self.hits)/(self.hits+self.misses)
+        
+    def close(self):
+        if self.queue is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.queue = None
+        with self.condition:
+            for frame in list(self.frames):
+                self.drop(frame)
+        if self.mmap_dir:
+            shutil.rmtree(self.mmap_dir, ignore_errors=True)
+            self.mmap_dir = ""
+    
+class Profiler():
+    """
+        Per cycle stage timers and counters
+        one JSON record per cycle is appended to filepath (JSONL)
+        filepath : metrics file, empty to only keep records in memory
+        use_cprofile : profile stages with cProfile, stats are dumped to filepath.prof
+    """
+    def __init__(self, filepath="", use_cprofile=False):
+        self.filepath = filepath
+        self.records = []
+        self.record = None
+        self.profile = None
+        if use_cprofile:
+            self.profile = cProfile.Profile()
+        self.tracking_start = None
+        self.last_busy = None
+        
+    @contextlib.contextmanager
+    def stage(self, name):
+        t = time.time()
+        if self.profile is not None:
+            self.profile.enable()
+        try:
+            yield
+        finally:
+            if self.profile is not None:
+                self.profile.disable()
+            if self.record is not None:
+                stages = self.record["stages"]
+                stages[name] = stages.get(name, 0)+time.time()-t
+            
+    def count(self, name, value=1):
+        # stages may run on their own, outside of any cycle
+        if self.record is None:
+            return
+        counts = self.record["counts"]
+        counts[name] = counts.get(name, 0)+value
+        
+    def begin_cycle(self, frame):
+        """
+            start a new record, closing the previous one
+        """
+        if self.record is not None:
+            self.end_cycle()
+        self.record = {"cycle": len(self.records), "frame": frame, "start": time.time(), "stages": {}, "counts": {}}
+        
+    def tracking_started(self):
+        """
+            tracking runs as a modal job after the cycle, its time is only known
+            when the modal operator sees the tracking frame moving (busy)
+        """
+        self.tracking_start = time.time()
+        self.last_busy = self.tracking_start
+        
+    def busy(self):
+        self.last_busy = time.time()
+        
+    def end_cycle(self):
+        record = self.record
+        end = time.time()
+        if self.tracking_start is not None:
+            record["stages"]["tracking"] = self.last_busy-self.tracking_start
+            # time spent waiting for the modal timer once tracking is done
+            record["idle"] = end-self.last_busy
+            self.tracking_start = None
+        record["time"] = end-record.pop("start")
+        self.records.append(record)
+        self.record = None
+        print("cycle %s frame %s %.4f seconds %s" % (record["cycle"], record["frame"], record["time"],
+            " ".join("%s:%s" % (k, v) for k, v in sorted(record["counts"].items()))))
+        if self.filepath:
+            with open(self.filepath, "a") as f:
+                f.write(json.dumps(record, sort_keys=True)+"\n")
+    
+    def close(self):
+        if self.record is not None:
+            self.end_cycle()
+        if self.profile is not None and self.filepath:
+            self.profile.dump_stats(self.filepath+".prof")
+
+class AdaptiveScheduler():
+    """
+        Number of frames to track between two filter/detect cycles
+        shortened when tracks die or move fast, lengthened when they survive on a well covered frame
+        survival : ratio of last cycle active tracks still tracked on current frame
+        motion : median marker motion per frame (normalized)
+        coverage : ratio of frame grid cells holding a marker
+    """
+    survival_low = 0.7
+    survival_high = 0.9
+    # max marker motion over one interval (normalized)
+    max_motion = 0.1
+
+    def __init__(self, interval, min_interval, max_interval):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.interval = min(self.max_interval, max(self.min_interval, interval))
+
+    def update(self, survival, motion, coverage, coverage_target):
+        """
+            return interval for next cycle
+        """
+        if survival < self.survival_low or motion*self.interval > self.max_motion:
+            self.interval = max(self.min_interval, self.interval//2)
+        elif survival > self.survival_high and coverage >= coverage_target:
+            self.interval = min(self.max_interval, self.interval+max(1, self.interval//2))
+        return self.interval
+
+def knn_indices(points, k):
+    """
+        k nearest neighbours of every point, excluding the point itself
+        points are bucketed in a uniform grid holding about k points per cell (one sort),
+        neighbours are searched in the 3x3 cells around each point,
+        points whose k-th neighbour may lie outside of these cells, or next to cells
+        holding more than 4k points (clusters), are searched among all points
+        points : (n, 2) array
+        return (n, k) indices array, -1 where less than k neighbours exist
+    """
+    n = len(points)
+    found = np.full((n, k), -1, dtype=np.int64)
+    if n < 2:
+        return found
+    lo = points.min(axis=0)
+    # cells sized per axis, so points along a line or a band still get about k per cell
+    span = np.maximum(points.max(axis=0)-lo, 1e-9)
+    area = float(span[0]*span[1])
+    if float(span.min()) <= 1e-9*float(span.max()):
+        cells = np.where(span > 1e-9, max(1, n//k), 1)
+    else:
+        side = math.sqrt(area*k/float(n))
+        cells = np.maximum(1, np.minimum((span/side).astype(np.int64), max(1, n//k)))
+    size_xy = span/cells
+    ij = np.minimum(((points-lo)/size_xy).astype(np.int64), cells-1)
+    key = ij[:, 0]*cells[1]+ij[:, 1]
+    ncells = int(cells[0]*cells[1])
+    order = np.argsort(key, kind="mergesort")
+    sorted_key = key[order]
+    start = np.searchsorted(sorted_key, np.arange(ncells))
+    count = np.diff(np.append(start, n))
+    
+    # padded cell -> points table, crowded cells are truncated
+    size = int(min(count.max(), 4*k))
+    table = np.full((ncells, size), -1, dtype=np.int64)
+    rank = np.arange(n)-start[sorted_key]
+    keep = rank < size
+    table[sorted_key[keep], rank[keep]] = order[keep]
+    truncated = count > size
+    
+    candidates = []
+    complete = np.ones(n, dtype=bool)
+    for di in (-1, 0, 1):
+        for dj in (-1, 0, 1):
+            ni = ij[:, 0]+di
+            nj = ij[:, 1]+dj
+            inside = (ni >= 0) & (ni < cells[0]) & (nj >= 0) & (nj < cells[1])
+            cell = np.where(inside, ni*cells[1]+nj, 0)
+            candidates.append(np.where(inside[:, np.newaxis], table[cell], -1))
+            complete &= ~(inside & truncated[cell])
+    candidates = np.concatenate(candidates, axis=1)
+    candidates[candidates == np.arange(n)[:, np.newaxis]] = -1
+    
+    d2 = ((points[candidates]-points[:, np.newaxis])**2).sum(axis=2)
+    d2[candidates < 0] = np.inf
+    m = min(k, candidates.shape[1])
+    nearest = np.argpartition(d2, m-1, axis=1)[:, :m]
+    rows = np.arange(n)[:, np.newaxis]
+    # upper bound of the k-th neighbour distance, when k neighbours were found
+    kth = d2[rows, nearest].max(axis=1)
+    if m < k:
+        kth[:] = np.inf
+    found[:, :m] = np.where(np.isfinite(d2[rows, nearest]), candidates[rows, nearest], -1)
+    
+    # distance from each point to the edges of its 3x3 cells, unbounded at the grid edges
+    low = lo+(ij-1)*size_xy
+    high = lo+(ij+2)*size_xy
+    margin = np.minimum(np.where(ij > 0, points-low, np.inf), np.where(ij < cells-1, high-points, np.inf)).min(axis=1)
+    exact = complete & (m == k) & (kth <= margin*margin)
+    
+    # search the others among points closer in x than their k-th neighbour found so far
+    check = np.flatnonzero(~exact)
+    if len(check) == 0:
+        return found
+    m = min(k, n-1)
+    by_x = np.argsort(points[:, 0], kind="mergesort")
+    xs = points[by_x, 0]
+    radius = np.where(np.isfinite(kth), np.sqrt(kth), np.inf)
+    first = np.searchsorted(xs, points[check, 0]-radius[check], side='left')
+    last = np.searchsorted(xs, points[check, 0]+radius[check], side='right')
+    for row, a, b in zip(check.tolist(), first.tolist(), last.tolist()):
+        near = by_x[a:b]
+        near = near[near != row]
+        if len(near) < m:
+            near = np.delete(np.arange(n), row)
+        d2 = ((points[near]-points[row])**2).sum(axis=1)
+        found[row, :m] = near[np.argpartition(d2, m-1)[:m]]
+        found[row, m:] = -1
+    return found
+
+def png_unfilter(data, height, width, bpp):
+    """
+        undo PNG row filters of decompressed data, return bytes (height, width, bpp)
+        Average and Paeth filters read the pixel on the left, rows using them are
+        unfiltered one anti-diagonal at a time, kept as columns of a skewed array
+    """
+    data = np.frombuffer(data, dtype=np.uint8)[:height*(width*bpp+1)].reshape(height, width*bpp+1)
+    filters = data[:, 0]
+    rows = data[:, 1:].reshape(height, width, bpp)
+    if np.all(filters <= 2):
+        out = np.empty((height, width, bpp), dtype=np.uint8)
+        prev = np.zeros((width, bpp), dtype=np.uint8)
+        for y in range(height):
+            row = rows[y]
+            if filters[y] == 1:
+                row = np.cumsum(row, axis=0, dtype=np.uint8)
+            elif filters[y] == 2:
+                row = row+prev
+            out[y] = row
+            prev = out[y]
+        return out
+    
+    # skew[y+x+2, y+1] is pixel (y, x), first two columns and first row are zero padding
+    skew = np.zeros((height+width+1, height+1, bpp), dtype=np.int16)
+    s0, s1, s2 = skew.strides
+    pixels = np.lib.stride_tricks.as_strided(skew[2:, 1:], shape=(height, width, bpp), strides=(s0+s1, s0, s2))
+    pixels[:] = rows
+    f = filters.astype(np.int16)[:, np.newaxis]
+    sub, up, average, paeth = [(f == i).astype(np.int16) for i in range(1, 5)]
+    for d in range(height+width-1):
+        # left, up and up left pixels
+        a = skew[d+1, 1:]
+        b = skew[d+1, :-1]
+        c = skew[d, :-1]
+        u = b-c
+        v = a-c
+        pa = np.abs(u)
+        pb = np.abs(v)
+        pc = np.abs(u+v)
+        nearest = np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c))
+        col = skew[d+2, 1:]
+        col += sub*a+up*b+average*((a+b) >> 1)+paeth*nearest
+        col &= 255
+        # rows this diagonal does not cross must stay zero
+        col[:max(0, d-width+1)] = 0
+        col[d+1:] = 0
+    return pixels.astype(np.uint8)
+    
+def png_header(header, path):
+    """
+        (width, height, depth, color, interlace) of the first 33 bytes of a PNG file
+        raise ValueError for files read_png does not decode
+    """
+    if header[:8] != b"\x89PNG\r\n\x1a\n" or header[12:16] != b"IHDR":
+        raise ValueError("%s is not a PNG file" % (path))
+    width, height, depth, color, compression, filtering, interlace = struct.unpack(">IIBBBBB", header[16:29])
+    if depth not in (8, 16) or interlace != 0 or color not in (0, 2, 3, 4, 6) or (color == 3 and depth != 8):
+        raise ValueError("%s: %d bit, interlaced or indexed PNG files are not supported" % (path, depth))
+    return width, height, depth, color, interlace
+    
+def read_png(path):
+    """
+        pixels of an 8 or 16 bit, non interlaced PNG file in [0, 1], top row first (height, width, channels)
+        decoded with zlib and NumPy, without bpy, so it may run on a thread
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    width, height, depth, color, interlace = png_header(data[:33], path)
+    channels = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}[color]
+    pos = 33
+    palette = None
+    chunks = []
+    while pos+8 <= len(data):
+        length, kind = struct.unpack(">I4s", data[pos:pos+8])
+        body = data[pos+8:pos+8+length]
+        pos += length+12
+        if kind == b"PLTE":
+            palette = np.frombuffer(body, dtype=np.uint8).reshape(-1, 3)
+        elif kind == b"IDAT":
+            chunks.append(body)
+        elif kind == b"IEND":
+            break
+    if color == 3 and palette is None:
+        raise ValueError("%s: indexed PNG file without palette" % (path))
+    
+    pixels = png_unfilter(zlib.decompress(b"".join(chunks)), height, width, channels*depth//8)
+    if color == 3:
+        return palette[pixels[:, :, 0]].astype(np.float32)/255.0
+    if depth == 16:
+        pixels = pixels.view(">u2").astype(np.float32)/65535.0
+        return pixels.reshape(height, width, channels)
+    return pixels.astype(np.float32)/255.0
+    
+def read_pnm(path):
+    """
+        pixels of a binary PGM (P5) or PPM (P6) file in [0, 1], top row first (height, width, channels)
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    match = re.match(br"(P[56])\s+(?:#.*\s+)*(\d+)\s+(?:#.*\s+)*(\d+)\s+(?:#.*\s+)*(\d+)\s", data)
+    if match is None:
+        raise ValueError("%s is not a binary PGM or PPM file" % (path))
+    magic, width, height, maxval = match.groups()
+    width, height, maxval = int(width), int(height), int(maxval)
+    channels = 1 if magic == b"P5" else 3
+    dtype = ">u2" if maxval > 255 else np.uint8
+    pixels = np.frombuffer(data, dtype=dtype, count=width*height*channels, offset=match.end())
+    return pixels.reshape(height, width, channels).astype(np.float32)/maxval
+    
+def probe_png(path):
+    with open(path, "rb") as f:
+        png_header(f.read(33), path)
+        
+def probe_pnm(path):
+    with open(path, "rb") as f:
+        if f.read(2) not in (b"P5", b"P6"):
+            raise ValueError("%s is not a binary PGM or PPM file" % (path))
+    
+# image sequence file extensions decoded without bpy: reader, header check raising ValueError
+IMAGE_READERS = {
+    ".png": (read_png, probe_png),
+    ".pgm": (read_pnm, probe_pnm),
+    ".ppm": (read_pnm, probe_pnm),
+    ".pnm": (read_pnm, probe_pnm),
+    }
+    
+def luminance(pixels):
+    """
+        grayscale of (height, width, channels) pixels
+    """
+    if pixels.shape[2] < 3:
+        return pixels[:, :, 0]
+    return pixels[:, :, :3].dot(np.array([0.2126, 0.7152, 0.0722], dtype=np.float32))
+    
+def read_blender_image(path):
+    """
+        pixels of any image file Blender can load (height, width, channels), bottom row first
+    """
+    image = bpy.data.images.load(path)
+    try:
+        width, height = image.size
+        channels = image.channels
+        pixels = np.empty(width*height*channels, dtype=np.float32)
+        try:
+            image.pixels.foreach_get(pixels)
+        except AttributeError:
+            # no bulk access to image pixels before 2.83
+            pixels[:] = image.pixels[:]
+    finally:
+        bpy.data.images.remove(image)
+    return pixels.reshape(height, width, channels)
+    
+class ImageSequence():
+    """
+        Frame files of an image sequence clip, resolved once on the main thread
+        threaded : frames are decoded without bpy (see IMAGE_READERS) and may be read
+                   on the frame cache prefetch thread, other formats are loaded by Blender
+    """
+    def __init__(self, clip):
+        self.pattern = None
+        self.threaded = False
+        if clip.source != 'SEQUENCE':
+            return
+        match = re.match(r"(.*?)(\d+)(\.\w+)$", bpy.path.abspath(clip.filepath))
+        if match is None:
+            return
+        head, digits, tail = match.groups()
+        self.pattern = (head, len(digits), tail)
+        self.first = int(digits)-clip.frame_start+clip.frame_offset
+        self.reader = None
+        if tail.lower() in IMAGE_READERS:
+            self.reader, probe = IMAGE_READERS[tail.lower()]
+            # formats the reader does not handle (interlaced PNG...) are loaded by Blender,
+            # only the header of the first frame is read
+            path = self.path(clip.frame_start)
+            try:
+                if path is not None:
+                    probe(path)
+                self.threaded = True
+            except ValueError:
+                self.threaded = False
+        
+    def path(self, frame):
+        """
+            file of scene frame, None when it does not exist
+        """
+        if self.pattern is None:
+            return None
+        head, width, tail = self.pattern
+        path = "%s%0*d%s" % (head, width, self.first+frame, tail)
+        if not os.path.exists(path):
+            return None
+        return path
+        
+    def read(self, frame):
+        """
+            grayscale pixels at scene frame, bottom row first
+            return None for movie clips or missing files
+        """
+        path = self.path(frame)
+        if path is None:
+            return None
+        if self.threaded:
+            return luminance(self.reader(path))[::-1]
+        return luminance(read_blender_image(path))
+        
+def box_filter(a, radius):
+    """
+        mean over (2*radius+1)^2 windows using an integral image, edges are extended
+    """
+    size = 2*radius+1
+    s = np.zeros((a.shape[0]+size, a.shape[1]+size), dtype=np.float64)
+    s[1:, 1:] = np.pad(a, radius, mode='edge').cumsum(axis=0).cumsum(axis=1)
+    return (s[size:, size:]-s[:-size, size:]-s[size:, :-size]+s[:-size, :-size])/(size*size)
+    
+def corner_strength(pixels, radius=2):
+    """
+        Shi-Tomasi corner strength: smallest eigenvalue of the gradient structure
+        tensor averaged over (2*radius+1)^2 windows, same shape as pixels
+    """
+    gy, gx = np.gradient(pixels)
+    sxx = box_filter(gx*gx, radius)
+    syy = box_filter(gy*gy, radius)
+    sxy = box_filter(gx*gy, radius)
+    return (sxx+syy)/2-np.sqrt(((sxx-syy)/2)**2+sxy*sxy)
+    
+def find_corner(pixels, x0, y0, x1, y1, radius=2):
+    """
+        strongest corner of pixels[y0:y1, x0:x1]
+        return (strength, x, y) in pixels or None for an empty area
+    """
+    if x1 <= x0 or y1 <= y0:
+        return None
+    # read a border around the area so the filters see real neighbours
+    pad = radius+1
+    height, width = pixels.shape
+    px0, py0 = max(0, x0-pad), max(0, y0-pad)
+    px1, py1 = min(width, x1+pad), min(height, y1+pad)
+    strength = corner_strength(pixels[py0:py1, px0:px1], radius)[y0-py0:y1-py0, x0-px0:x1-px0]
+    y, x = np.unravel_index(np.argmax(strength), strength.shape)
+    return strength[y, x], x0+x, y0+y
+    
+def downscale(pixels, factor):
+    """
+        mean of factor x factor pixel blocks, last rows and columns not filling a block are dropped
+    """
+    if factor <= 1:
+        return pixels
+    height, width = pixels.shape
+    h, w = height//factor, width//factor
+    image = pixels[:h*factor, :w*factor].astype(np.float32)
+    # strided sums of rows then columns, several times cheaper than a mean over reshaped blocks
+    rows = image[0::factor]
+    for i in range(1, factor):
+        rows = rows+image[i::factor]
+    blocks = rows[:, 0::factor]
+    for i in range(1, factor):
+        blocks = blocks+rows[:, i::factor]
+    return blocks*(1.0/(factor*factor))
+    
+def build_pyramid(pixels, levels):
+    """
+        list of (image, x gradient, y gradient) from full resolution to coarsest,
+        each level half the size of the previous one
+    """
+    pyramid = []
+    image = pixels.astype(np.float32)
+    for level in range(levels):
+        gy, gx = np.gradient(image)
+        pyramid.append((image, gx, gy))
+        height, width = image.shape
+        if height < 16 or width < 16:
+            break
+        h, w = height//2*2, width//2*2
+        image = 0.25*(image[0:h:2, 0:w:2]+image[1:h:2, 0:w:2]+image[0:h:2, 1:w:2]+image[1:h:2, 1:w:2])
+    return pyramid
+    
+def sample(image, x, y):
+    """
+        bilinear interpolation of image at float pixel coordinates x, y (same shape arrays)
+        return values and mask of coordinates inside image
+    """
+    height, width = image.shape
+    inside = (x >= 0) & (y >= 0) & (x <= width-1) & (y <= height-1)
+    x = np.clip(x, 0, width-1.001)
+    y = np.clip(y, 0, height-1.001)
+    x0 = x.astype(np.int32)
+    y0 = y.astype(np.int32)
+    ax = x-x0
+    ay = y-y0
+    # gathers from the flat array are much cheaper than 2d fancy indexing
+    flat = image.ravel()
+    index = y0*width+x0
+    top = flat.take(index)*(1-ax)+flat.take(index+1)*ax
+    index += width
+    bottom = flat.take(index)*(1-ax)+flat.take(index+1)*ax
+    return top*(1-ay)+bottom*ay, inside
+    
+def pyramid_levels(shape, radius=7, max_levels=4, scale=1):
+    """
+        number of pyramid levels for frames of shape (height, width),
+        the coarsest level keeps at least 4 tracking windows across its smallest side
+        scale : frames are downscaled by this power of 2, motion is that much smaller in pixels,
+                so the coarsest level is the one of full resolution frames
+    """
+    size = min(shape)*scale
+    levels = 1
+    while levels < max_levels and size*0.5**levels >= 4*(2*radius+1):
+        levels += 1
+    while scale > 1 and levels > 1:
+        scale //= 2
+        levels -= 1
+    return levels
+    
+def klt_track(prev, curr, points, radius=7, iterations=10, max_error=0.1, min_eigen=1e-5, guess=None):
+    """
+        pyramidal Lucas-Kanade, all points at once
+        prev, curr : build_pyramid of previous and current frames
+        points : (n, 2) pixel positions in previous frame
+        max_error : lost when mean absolute intensity difference is over this
+        guess : (n, 2) expected displacements in pixels, None for no motion
+        windows only need to fit in the full resolution frame,
+        coarse levels sample clamped to their edges
+        return (n, 2) positions in current frame and mask of tracked points
+    """
+    n = len(points)
+    # keep sampled windows small enough to stay in cache
+    chunk = 256
+    if n > chunk:
+        parts = [klt_track(prev, curr, points[i:i+chunk], radius, iterations, max_error, min_eigen,
+            None if guess is None else guess[i:i+chunk]) for i in range(0, n, chunk)]
+        return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+    offsets = np.arange(-radius, radius+1, dtype=np.float32)
+    ox, oy = [o.ravel() for o in np.meshgrid(offsets, offsets)]
+    ok = np.ones(n, dtype=bool)
+    levels = min(len(prev), len(curr))
+    if guess is None:
+        d = np.zeros((n, 2), dtype=np.float32)
+    else:
+        d = np.array(guess, dtype=np.float32)*0.5**(levels-1)
+    for level in reversed(range(levels)):
+        scale = 0.5**level
+        image, gx, gy = prev[level]
+        target = curr[level][0]
+        px = points[:, 0:1]*scale+ox
+        py = points[:, 1:2]*scale+oy
+        template, inside = sample(image, px, py)
+        tx = sample(gx, px, py)[0]
+        ty = sample(gy, px, py)[0]
+        gxx = (tx*tx).sum(axis=1)
+        gyy = (ty*ty).sum(axis=1)
+        gxy = (tx*ty).sum(axis=1)
+        det = gxx*gyy-gxy*gxy
+        # untrackable when gradient is too weak in some direction
+        eigen = (gxx+gyy)/2-np.sqrt(((gxx-gyy)/2)**2+gxy*gxy)
+        usable = eigen > min_eigen*len(ox)
+        if level == 0:
+            ok &= inside.all(axis=1) & usable
+        det[det == 0] = 1
+        if level < levels-1:
+            d *= 2
+        # iterate on points not converged yet only
+        active = np.flatnonzero(usable)
+        for i in range(iterations):
+            if len(active) == 0:
+                break
+            warped = sample(target, px[active]+d[active, 0:1], py[active]+d[active, 1:2])[0]
+            error = template[active]-warped
+            bx = (error*tx[active]).sum(axis=1)
+            by = (error*ty[active]).sum(axis=1)
+            dx = (gyy[active]*bx-gxy[active]*by)/det[active]
+            dy = (gxx[active]*by-gxy[active]*bx)/det[active]
+            d[active, 0] += dx
+            d[active, 1] += dy
+            active = active[np.abs(dx)+np.abs(dy) >= 0.01]
+    warped, inside = sample(curr[0][0], points[:, 0:1]+ox+d[:, 0:1], points[:, 1:2]+oy+d[:, 1:2])
+    ok &= inside.all(axis=1)
+    ok &= np.abs(sample(prev[0][0], points[:, 0:1]+ox, points[:, 1:2]+oy)[0]-warped).mean(axis=1) < max_error
+    return points+d, ok
+    
 def draw_callback(self, context):
     #print("draw_callback : %s" % (self.progress))
     self.gl.ProgressBar(10, 24, 200, 16, self.start, self.progress)
     self.gl.String(str(int(100*abs(self.progress)))+"% ESC to Cancel", 14, 28, 10, self.gl.white)
     
-class OP_Tracking_auto_tracker(Operator):
-    """Autotrack. Esc to cancel."""
-    bl_idname = "tracking.auto_track"
-    bl_label = "AutoTracking"
-
-    _timer = None
-    _draw_handler = None
+class ClipEditorBackend():
+    """
+        Feature detection, tracking and deletion through Blender clip operators
+        override : context override dict pointing to a clip editor,
+                   None to use the current context (operator running in a clip editor)
+    """
+    def __init__(self, override=None):
+        self.override = override
+        # clip name -> ImageSequence
+        self.sequences = {}
     
-    gl = GlDrawOnScreen()
-    progress = 0
-    limits = 0
-    t = 0
+    @classmethod
+    def from_clip(cls, clip, scene):
+        """
+            find a clip editor in any screen and show clip in it
+            screens are available as data so this also works under blender -b
+        """
+        for screen in bpy.data.screens:
+            for area in screen.areas:
+                if area.type != 'CLIP_EDITOR':
+                    continue
+                space = area.spaces.active
+                space.clip = clip
+                region = None
+                for r in area.regions:
+                    if r.type == 'WINDOW':
+                        region = r
+                override = {
+                    'window': bpy.context.window,
+                    'screen': screen,
+                    'area': area,
+                    'region': region,
+                    'space_data': space,
+                    'scene': scene,
+                    'edit_movieclip': clip
+                    }
+                return cls(override)
+        raise RuntimeError("Autotrack needs a clip editor area in one of the screens")
+        
+    def call(self, op, *args, **kwargs):
+        if self.override is None:
+            return op(*args, **kwargs)
+        return op(self.override, *args, **kwargs)
+        
+    def select_all(self, action='DESELECT'):
+        self.call(bpy.ops.clip.select_all, action=action)
+        
+    def detect_features(self, **kwargs):
+        self.call(bpy.ops.clip.detect_features, **kwargs)
+        
+    def delete_tracks(self, to_delete):
+        self.select_all(action='DESELECT')
+        # delete_track skips hidden tracks, dead tracks are hidden by the engine
+        for track in to_delete:
+            track.hide = False
+            track.select = True
+        self.call(bpy.ops.clip.delete_track)
+        
+    def sequence(self, clip):
+        sequence = self.sequences.get(clip.name)
+        if sequence is None:
+            sequence = ImageSequence(clip)
+            self.sequences[clip.name] = sequence
+        return sequence
+        
+    def threaded_frames(self, clip):
+        """
+            frame_pixels of clip does not use bpy and may run on the frame cache prefetch thread
+        """
+        return self.sequence(clip).threaded
+        
+    def frame_pixels(self, clip, frame):
+        return self.sequence(clip).read(frame)
+        
+    def track_markers(self, backwards, invoke=False):
+        # INVOKE_DEFAULT to show progress, both take account of frame_limit
+        if invoke:
+            return self.call(bpy.ops.clip.track_markers, 'INVOKE_DEFAULT', backwards=backwards, sequence=True)
+        return self.call(bpy.ops.clip.track_markers, 'EXEC_DEFAULT', backwards=backwards, sequence=True)
     
+class SettingsOverride():
+    """
+        AutotrackerSettings values with some of them replaced,
+        so batch runs do not change the settings shown in the UI
+    """
+    def __init__(self, settings, **overrides):
+        self.settings = settings
+        self.__dict__.update(overrides)
+    def __getattr__(self, name):
+        return getattr(self.settings, name)
+    
+class AutotrackEngine():
+    """
+        Autotrack detect / track / filter loop, independent of the operator UI
+        clip : movie clip to track
+        props : AutotrackerSettings or any object providing the same values
+        scene : scene driving current frame and frame range
+        backend : detection, tracking and deletion provider (ClipEditorBackend)
+        store : TrackStore the algorithms read and write tracks through, default to clip tracks
+    """
+    def __init__(self, clip, props, scene, backend, store=None):
+        self.clip = clip
+        self.props = props
+        self.scene = scene
+        self.backend = backend
+        if store is None:
+            store = RnaTrackStore(clip, backend)
+        self.store = store
+        self.summaries = TrackSummaries(store)
+        # tracks that may still change, key -> track in clip order
+        self.live = collections.OrderedDict()
+        # tracks hidden before autotracking, left hidden and never compacted
+        self.user_hidden = set()
+        for track in store.tracks():
+            if store.hidden(track):
+                self.user_hidden.add(store.key(track))
+            elif not store.locked(track):
+                self.live[store.key(track)] = track
+        # tracks hidden by the engine, shown again by show_tracks
+        self.hidden = set()
+        # deleted tracks waiting for flush_deleted
+        self.dead = collections.OrderedDict()
+        # tracks shorter than this are deleted, 0 in workers whose tracks are pruned once merged
+        self.min_length = props.small_tracks
+        self.cycles = 0
+        self.profiler = Profiler(bpy.path.abspath(props.metrics_path), props.use_cprofile)
+        # built-in detector and tracker run on proxy frames, refine moves markers to full resolution
+        self.proxy_scale = int(props.proxy_scale)
+        # FrameCache of proxy frames, built when a built-in stage first needs frames
+        self.frames = None
+        self.start_frame = scene.frame_current
+        # last frame markers were refined on
+        self.keyframe = scene.frame_current
+        # frame -> (pixels, build_pyramid) of full resolution frames refine read, only the last keyframe is kept
+        self.refine_pyramids = {}
+        # frames tracked between two cycles, see update_schedule
+        self.separation = props.frame_separation
+        self.scheduler = AdaptiveScheduler(props.frame_separation, props.min_separation, props.max_separation)
+        if props.schedule == 'ADAPTIVE':
+            self.separation = self.scheduler.interval
+        # pointers of tracks selected by last cycle, for survival rate
+        self.last_active = set()
+        self.motion = 0.0
+        self.coverage = 0.0
+        # pointer -> recent motion residual, relative to mean motion, see remove_jumping
+        self.residuals = {}
+        # pointer -> [name, chunk] of tracks written by previous checkpoints, number of files they use
+        self.saved = {}
+        self.chunks = 0
+        # [name, chunk] of saved tracks removed after their chunk was written
+        self.removed = []
+        # pointers of tracks compact_tracks did process
+        self.compacted = set()
+        # get_vars snapshot while a cycle is prepared
+        self.cycle_vars = None
+        
     def find_track_start(self, track):
-        for m in track.markers:
-            if not m.mute:
-                return m.frame
-        return track.markers[0].frame
+        first, last, start, end = self.summaries.get(track)
+        if start is not None:
+            return start
+        return first
         
     def find_track_end(self, track):
-        for m in reversed(track.markers):
-            if not m.mute:
-                return m.frame
-        return track.markers[-1].frame-1
+        first, last, start, end = self.summaries.get(track)
+        if end is not None:
+            return end
+        return last-1
         
     def find_track_length(self, track):
         tstart = self.find_track_start(track)
         tend   = self.find_track_end(track)
         return tend-tstart
     
-    def show_tracks(self, context):
-        scene = context.scene
-        clip  = context.area.spaces.active.clip
-        tracks = clip.tracking.tracks
-        for track in tracks:
-            track.hide = False
+    def frame_cache(self):
+        if self.frames is None:
+            props = self.props
+            if props.frame_cache_uint8:
+                dtype = np.uint8
+            else:
+                dtype = np.float32
+            self.frames = FrameCache(lambda frame: self.load_proxy(frame), props.frame_cache_size,
+                bpy.path.abspath(props.frame_cache_dir), dtype, threaded=self.backend.threaded_frames(self.clip))
+        return self.frames
         
-    def get_vars_from_context(self, context):    
-        scene = context.scene
-        props = context.window_manager.autotracker_props
-        clip  = context.area.spaces.active.clip
-        tracks = clip.tracking.tracks
+    def get_frame(self, frame):
+        """
+            grayscale pixels of frame through the frame cache, None when not readable
+        """
+        frames = self.frame_cache()
+        hits = frames.hits
+        pixels = frames.get(frame)
+        if frames.hits > hits:
+            self.profiler.count("frame_hits")
+        else:
+            self.profiler.count("frame_misses")
+        return pixels
+    
+    def load_proxy(self, frame):
+        pixels = self.backend.frame_pixels(self.clip, frame)
+        if pixels is None:
+            return None
+        return downscale(pixels, self.proxy_scale)
+        
+    def finish(self):
+        # tracks were not filtered while autotracking
+        if self.cycles > 0 and not self.props.cycle_filter:
+            self.cleanup_shot()
+        # last tracked frames since last keyframe
+        if self.cycles > 0 and self.proxy_scale > 1 and self.props.refine_every > 0:
+            self.refine(list(self.live.values()), self.keyframe, self.scene.frame_current)
+        self.refine_pyramids.clear()
+        if self.cycles > 0 and self.props.compact_every > 0:
+            self.compact_tracks()
+        self.flush_deleted()
+        if self.cycles > 0 and self.props.checkpoint_every > 0:
+            self.mark_finished(bpy.path.abspath(self.props.checkpoint_dir))
+        self.show_tracks()
+        self.profiler.close()
+        if self.frames is not None:
+            print("frame cache hit rate %.2f" % (self.frames.hit_rate()))
+            self.frames.close()
+            self.frames = None
+        
+    def hide_track(self, track):
+        self.store.set_hidden(track, True)
+        self.hidden.add(self.store.key(track))
+        
+    def show_tracks(self):
+        for track in self.store.tracks():
+            if self.store.key(track) in self.hidden:
+                self.store.set_hidden(track, False)
+        self.hidden.clear()
+        
+    def get_vars(self):
+        """
+            return scene, props, clip, store, current frame and start frame of last tracked window
+            taken once per cycle by prepare_cycle
+        """
+        if self.cycle_vars is not None:
+            return self.cycle_vars
+        scene = self.scene
+        props = self.props
+        clip  = self.clip
         current_frame = scene.frame_current
         clip_end   = clip.frame_start+clip.frame_duration
         clip_start = clip.frame_start
         if props.track_backwards:
-            last_frame = min(clip_end, current_frame+props.frame_separation)
+            last_frame = min(clip_end, current_frame+self.separation)
         else:
-            last_frame = max(clip_start, current_frame-props.frame_separation)
-        return scene, props, clip, tracks, current_frame, last_frame
+            last_frame = max(clip_start, current_frame-self.separation)
+        return scene, props, clip, self.store, current_frame, last_frame
     
     def delete_tracks(self, to_delete):
-        bpy.ops.clip.select_all(action='DESELECT')
+        """
+            mark tracks as dead, they are hidden and excluded from every stage
+            until flush_deleted removes them all at once
+        """
         for track in to_delete:
-            track.select = True
-        bpy.ops.clip.delete_track()
+            key = self.store.key(track)
+            self.live.pop(key, None)
+            self.summaries.invalidate(track)
+            self.dead[key] = track
+            self.hide_track(track)
+            
+    def flush_deleted(self):
+        if len(self.dead) == 0:
+            return
+        # removed tracks pointers may be reused by new tracks
+        for key in self.dead:
+            saved = self.saved.pop(key, None)
+            if saved is not None:
+                self.removed.append(saved)
+            self.compacted.discard(key)
+            self.hidden.discard(key)
+        self.store.remove(list(self.dead.values()))
+        self.profiler.count("flushed", len(self.dead))
+        self.dead.clear()
         
     # DETECT FEATURES
-    def auto_features(self, context):
+    def auto_features(self):
         """
             Detect features 
         """
-        t = time.time()
-        
-        scene, props, clip, tracks, current_frame, last_frame = self.get_vars_from_context(context)
+        scene, props, clip, store, current_frame, last_frame = self.get_vars()
         
         selected = []
-        old = []
         to_delete = []
         width = clip.size[0]
         delete_threshold = float(props.delete_threshold)/100.0
         
-        bpy.ops.clip.select_all(action='DESELECT')
+        store.deselect_all()
         
-        # Detect Features
-        bpy.ops.clip.detect_features(
+        # snapshot old marker positions into a grid
+        old = SpatialGrid(delete_threshold)
+        for track in self.live.values():
+            if store.hidden(track) or store.locked(track):
+                continue
+            i = store.find(track, current_frame)
+            if (i is not None) and (not store.mute(track, i)):
+                old.insert(store.co(track)[i])
+        
+        cells = int(math.ceil(1.0/old.radius))
+        self.coverage = len(old.cells)/float(cells*cells)
+        if props.schedule == 'ADAPTIVE' and self.coverage*100.0 >= props.coverage_target:
+            self.profiler.count("detection_skipped")
+            return
+        
+        # built-in detector only fills empty grid cells, grease pencil placement needs the operator
+        if props.detector == 'GRID' and props.placement_list == 'FRAME':
+            pixels = self.get_frame(current_frame)
+            if pixels is not None:
+                self.detect_empty_cells(old, pixels)
+                return
+        
+        # Detect Features, new tracks are added at the end of tracks
+        tracks = store.tracks()
+        first_new = len(tracks)
+        self.backend.detect_features(
             threshold=props.df_threshold,
             min_distance=props.df_distance/100.0*width,
             margin=props.df_margin/100.0*width,
             placement=props.placement_list
             )
             
-        # filter new and old tracks
-        for track in tracks:
-            if track.hide or track.lock:
+        for track in tracks[first_new:]:
+            if store.hidden(track) or store.locked(track) or not store.selected(track):
                 continue
-            marker = track.markers.find_frame(current_frame)
-            if marker is not None:
-                if (not track.select) and (not marker.mute):
-                    old.append(track)
-                if track.select:
-                    selected.append(track)
-        
-        added_tracks = len(selected)
+            i = store.find(track, current_frame)
+            if i is not None:
+                selected.append((track, store.co(track)[i]))
         
         # Select overlapping new markers
-        for track_new in selected:
-            marker0 = track_new.markers.find_frame(current_frame)
-            for track_old in old:
-                marker1 = track_old.markers.find_frame(current_frame)
-                distance = (marker1.co-marker0.co).length
-                if distance < delete_threshold:
-                    to_delete.append(track_new)
-                    added_tracks -= 1
-                    break
+        for track_new, co in selected:
+            if old.find_near(co) is not None:
+                to_delete.append(track_new)
         
         # Delete Overlapping Markers
         self.delete_tracks(to_delete)
-        print("auto_features %.4f seconds add:%s tracks." % (time.time()-t, added_tracks))
+        rejected = set(store.key(track) for track in to_delete)
+        for track, co in selected:
+            if store.key(track) not in rejected:
+                self.live[store.key(track)] = track
+        self.profiler.count("detected", len(selected))
+        self.profiler.count("rejected_overlap", len(to_delete))
+    
+    def detect_empty_cells(self, old, pixels):
+        """
+            detect corners only inside grid cells without markers,
+            and create tracks for the ones we keep
+            old : SpatialGrid of current markers, cells are delete_threshold wide
+            pixels : grayscale frame, bottom row first
+        """
+        scene, props, clip, store, current_frame, last_frame = self.get_vars()
+        height, width = pixels.shape
+        margin = int(props.df_margin/100.0*width)
+        # corner strength is the squared gradient in the weakest direction
+        min_strength = (props.df_threshold/10.0)**2
+        cells = int(math.ceil(1.0/old.radius))
+        
+        candidates = []
+        empty = 0
+        for i in range(cells):
+            for j in range(cells):
+                if (i, j) in old.cells:
+                    continue
+                empty += 1
+                x0 = max(margin, int(i*old.radius*width))
+                y0 = max(margin, int(j*old.radius*height))
+                x1 = min(width-margin, int((i+1)*old.radius*width))
+                y1 = min(height-margin, int((j+1)*old.radius*height))
+                corner = find_corner(pixels, x0, y0, x1, y1)
+                if corner is not None and corner[0] >= min_strength:
+                    candidates.append(corner)
+        
+        # strongest first, keep df_distance between new features
+        added = SpatialGrid(props.df_distance/100.0)
+        for strength, x, y in sorted(candidates, reverse=True):
+            co = ((x+0.5)/width, (y+0.5)/height)
+            if old.find_near(co) is not None or added.find_near(co) is not None:
+                continue
+            added.insert(co)
+            track = store.new_track(current_frame, co)
+            store.select(track)
+            self.live[store.key(track)] = track
+        
+        self.profiler.count("empty_cells", empty)
+        self.profiler.count("detected", len(added))
     
     # AUTOTRACK FRAMES
-    def track_frames_backward(self):
-        # INVOKE_DEFAULT to show progress and take account of frame_limit
-        t = time.time()
-        res = bpy.ops.clip.track_markers('INVOKE_DEFAULT', backwards=True, sequence=True)
-        print("track_frames_backward %.2f seconds %s" % (time.time()-t, res))
+    def track_frames(self, invoke=False):
+        """
+            track selected markers until frames_limit is reached
+            invoke: run tracking as a modal job with progress (operator UI),
+                    else return once tracking is done
+            return True when tracking is done on return
+        """
+        if self.props.tracker == 'KLT':
+            with self.profiler.stage("tracking"):
+                if self.track_klt():
+                    return True
+        if invoke:
+            self.profiler.tracking_started()
+            self.backend.track_markers(backwards=self.props.track_backwards, invoke=True)
+            return False
+        with self.profiler.stage("tracking"):
+            self.backend.track_markers(backwards=self.props.track_backwards)
+        return True
+    
+    def track_klt(self):
+        """
+            track selected tracks separation frames with the built-in
+            pyramidal Lucas-Kanade tracker, all markers at once
+            return False when frames can not be read, to use track_markers instead
+        """
+        scene, props, clip, store, current_frame, last_frame = self.get_vars()
+        frame_start, frame_end, frame_duration = self.get_frame_range()
+        if props.track_backwards:
+            step = -1
+            end = max(frame_start, current_frame-self.separation)
+        else:
+            step = 1
+            # frame_end is one past the last clip frame when the clip is shorter than the scene
+            end = min(frame_end, clip.frame_start+clip.frame_duration-1, current_frame+self.separation)
         
-    def track_frames_forward(self):
-        # INVOKE_DEFAULT to show progress and take account of frame_limit
-        t = time.time()
-        res = bpy.ops.clip.track_markers('INVOKE_DEFAULT', backwards=False, sequence=True)
-        print("track_frames_forward %.2f seconds %s" % (time.time()-t, res))
+        pixels = self.get_frame(current_frame)
+        if pixels is None:
+            return False
+        height, width = pixels.shape
+        
+        selected = []
+        points = []
+        for track in self.live.values():
+            if not store.selected(track):
+                continue
+            i = store.find(track, current_frame)
+            if i is not None and not store.mute(track, i):
+                x, y = store.co(track)[i]
+                selected.append(track)
+                points.append((x*width-0.5, y*height-0.5))
+        if len(selected) == 0:
+            return True
+        
+        levels = pyramid_levels(pixels.shape, scale=self.proxy_scale)
+        prev = build_pyramid(pixels, levels)
+        points = np.array(points, dtype=np.float32)
+        alive = np.arange(len(selected))
+        # tracked positions per frame, lost tracks get a muted marker like track_markers does
+        tracked = []
+        lost = []
+        # last frame some track reached
+        last_tracked = current_frame
+        for frame in range(current_frame+step, end+step, step):
+            pixels = self.get_frame(frame)
+            # missing frame, tracking ends there
+            if pixels is None:
+                break
+            curr = build_pyramid(pixels, levels)
+            last_points = points[alive]
+            points[alive], ok = klt_track(prev, curr, last_points)
+            tracked.append((frame, alive[ok], points[alive[ok]]))
+            lost.append((frame, alive[~ok], last_points[~ok]))
+            alive = alive[ok]
+            if len(alive) == 0:
+                break
+            last_tracked = frame
+            prev = curr
+        
+        # write back, one insert per track
+        inserts = [([], [], []) for track in selected]
+        for markers, mute in ((tracked, False), (lost, True)):
+            for f, rows, pts in markers:
+                co = (pts+0.5)/np.array([width, height], dtype=np.float32)
+                for i, (x, y) in zip(rows.tolist(), co.tolist()):
+                    inserts[i][0].append(f)
+                    inserts[i][1].append((x, y))
+                    inserts[i][2].append(mute)
+        for track, (frames, co, mute) in zip(selected, inserts):
+            if len(frames) > 0:
+                store.insert_markers(track, frames, co, mute)
+        self.profiler.count("klt_markers", sum(len(rows) for f, rows, pts in tracked))
+        
+        # like track_markers, stop on last frame some track reached
+        scene.frame_current = last_tracked
+        return True
     
-    def get_active_tracks(self, context):
-        scene, props, clip, tracks, current_frame, last_frame = self.get_vars_from_context(context)
+    def get_active_tracks(self):
+        scene, props, clip, store, current_frame, last_frame = self.get_vars()
         # Select active trackers for tracking
-        #bpy.ops.clip.select_all(action='DESELECT')
         active_tracks = []
-        for track in tracks:
-            if track.hide or track.lock:
+        for track in self.live.values():
+            if store.hidden(track) or store.locked(track):
                 continue
-            if len(track.markers) < 2:
+            frames, index = store.frames(track)
+            if len(frames) < 2:
                 active_tracks.append(track)
             else:
-                marker = track.markers.find_frame(current_frame)
-                if (marker is not None) and (not marker.mute):
+                i = index.get(current_frame)
+                if (i is not None) and (not store.mute(track, i)):
                     active_tracks.append(track) 
         return active_tracks
     
-    def select_active_tracks(self, context):
-        t = time.time()
-        scene, props, clip, tracks, current_frame, last_frame = self.get_vars_from_context(context)
+    def limit_active_tracks(self):
+        """
+            keep at most max_active tracks active, retiring the ones of lowest priority:
+            age (up to minimum track length) + spread (1 / markers sharing its grid cell)
+            - recent motion residual (median one for tracks not measured yet)
+            retired tracks shorter than minimum track length are deleted
+        """
+        scene, props, clip, store, current_frame, last_frame = self.get_vars()
+        active_tracks = self.get_active_tracks()
+        excess = len(active_tracks)-props.max_active
+        if props.max_active == 0 or excess <= 0:
+            return
+        
+        grid = SpatialGrid(float(props.delete_threshold)/100.0)
+        cells = []
+        for track in active_tracks:
+            i = store.find(track, current_frame)
+            if i is None:
+                i = 0
+            co = store.co(track)[i]
+            cells.append(grid.cell(co))
+            grid.insert(co)
+        
+        # tracks not measured yet (new detections) get the median residual, not a perfect one
+        measured = [self.residuals[store.key(track)] for track in active_tracks
+            if store.key(track) in self.residuals]
+        if len(measured) > 0:
+            neutral = float(np.median(measured))
+        else:
+            neutral = 0.0
+        priority = []
+        for i, track in enumerate(active_tracks):
+            age = min(1.0, self.find_track_length(track)/float(max(1, props.small_tracks)))
+            spread = 1.0/len(grid.cells[cells[i]])
+            residual = min(1.0, self.residuals.get(store.key(track), neutral))
+            priority.append((age+spread-residual, i))
+        
+        to_delete = []
+        for value, i in heapq.nsmallest(excess, priority):
+            track = active_tracks[i]
+            if self.find_track_length(track) < props.small_tracks:
+                to_delete.append(track)
+            else:
+                del self.live[store.key(track)]
+        self.delete_tracks(to_delete)
+        self.profiler.count("over_budget", excess)
+        
+    def select_active_tracks(self):
+        store = self.store
         # Select active trackers for tracking
-        bpy.ops.clip.select_all(action='DESELECT')
-        selected = self.get_active_tracks(context)
+        store.deselect_all()
+        selected = self.get_active_tracks()
         for track in selected:
-            track.select = True
-        print("select_active_tracks %.2f seconds selected:%s" % (time.time()-t, len(selected)))
+            store.select(track)
+        self.profiler.count("alive", len(selected))
         return selected
         
-    def estimate_motion(self, context, last, frame):
+    def get_marker_window(self, tracks, frames):
+        """
+            load markers of a frame window into arrays with one bulk read per track
+            frames: frame range ordered in tracking direction
+            return tracks list, co array (tracks x frames x 2) and validity mask (tracks x frames)
         """
-            compute mean pixel motion for current frame
+        store = self.store
+        step = frames.step
+        rows = [track for track in tracks if not (store.hidden(track) or store.locked(track))]
+        co = np.zeros((len(rows), len(frames), 2), dtype=np.float32)
+        valid = np.zeros((len(rows), len(frames)), dtype=bool)
+        for i, track in enumerate(rows):
+            marker_frames = store.frames(track)[0]
+            col = (marker_frames-frames.start)*step
+            inside = (col >= 0) & (col < len(frames))
+            co[i, col[inside]] = store.co(track)[inside]
+            valid[i, col[inside]] = True
+        return rows, co, valid
+        
+    def estimate_motion(self, co, valid):
+        """
+            compute mean pixel motion for every frame of a window
             TODO: use statistic here to make filtering more efficient
-            last : last frame number
-            frame: current frame number
-            return mean pixel distance error
+            co, valid : window arrays from get_marker_window
+            return distance (tracks x frames-1) between each frame and the previous one,
+            mask of markers available on both frames and mean distance per frame
         """
-        scene, props, clip, tracks, current_frame, last_frame = self.get_vars_from_context(context)
-        nbtracks = 0
-        distance = 0.0
-        for track in tracks:
-            if track.hide or track.lock:
+        both = valid[:, 1:] & valid[:, :-1]
+        distance = np.sqrt(((co[:, 1:]-co[:, :-1])**2).sum(axis=2))
+        # skip fixed tracks
+        moving = both & (distance > 0)
+        nbtracks = moving.sum(axis=0)
+        total = np.where(moving, distance, 0).sum(axis=0)
+        # arbitrary set to prevent division by 0 error
+        mean = np.full(nbtracks.shape, 10.0)
+        mean[nbtracks > 0] = total[nbtracks > 0] / nbtracks[nbtracks > 0]
+        return distance, both, mean
+    
+    # REMOVE SMALL TRACKS
+    def remove_small(self):
+        scene, props, clip, store, current_frame, last_frame = self.get_vars()
+        to_delete = []
+        store.deselect_all()
+        for track in self.live.values():
+            if store.hidden(track) or store.locked(track):
                 continue
-            marker0 = track.markers.find_frame(frame)
-            marker1 = track.markers.find_frame(last)
-            if marker0 is not None and marker1 is not None:
-                d = (marker0.co-marker1.co).length
-                # skip fixed tracks
-                if d > 0:
-                    distance += d
-                    nbtracks += 1
-        if nbtracks > 0:
-            mean = distance / nbtracks
+            frames, index = store.frames(track)
+            if len(frames) > 1:
+                if index.get(current_frame) is None and self.find_track_length(track) < self.min_length:
+                    to_delete.append(track)
+        self.delete_tracks(to_delete)
+        self.profiler.count("deleted", len(to_delete))
+    
+    def split_track(self, track, split_frame, skip=0, backwards=None):
+        """
+            move markers from split_frame to the end of the track onto a new track
+            markers closer than skip frames from split_frame are dropped
+            the old track is truncated, its split_frame marker muted and the track hidden
+            backwards : direction of the track end, tracking direction when None
+            return new track
+        """
+        scene, props, clip, store, current_frame, last_frame = self.get_vars()
+        if backwards is None:
+            backwards = props.track_backwards
+        if backwards:
+            end = scene.frame_start
+            step = -1
+        else:
+            end = scene.frame_end
+            step = 1
+        
+        # find the contiguous tail from split_frame
+        frames, index = store.frames(track)
+        co = store.co(track)
+        tail = []
+        for frame in range(split_frame, end, step):
+            i = index.get(frame)
+            if i is None:
+                break
+            tail.append((frame, i))
+        
+        new_track = store.new_track(split_frame)
+        kept = [(frame, i) for frame, i in tail if abs(frame - split_frame) >= skip]
+        store.insert_markers(new_track, [frame for frame, i in kept], [co[i].tolist() for frame, i in kept])
+        
+        # truncate old track, deleting from the end of the markers array first
+        store.delete_markers(track, [frame for frame, i in sorted(tail[1:], key=lambda f: -f[1])])
+        if len(tail) > 0:
+            store.set_mute(track, split_frame)
+            self.hide_track(track)
+            self.live.pop(store.key(track), None)
+        self.live[store.key(new_track)] = new_track
+        self.summaries.invalidate(track)
+        self.summaries.invalidate(new_track)
+        return new_track
+                    
+    # REMOVE JUMPING MARKERS
+    def remove_jumping(self):
+        
+        scene, props, clip, store, current_frame, last_frame = self.get_vars()
+        
+        if props.track_backwards:
+            step = -1
+        else:
+            step = 1
+        
+        # window in tracking direction, starting one frame before last_frame
+        frames = range(last_frame-step, current_frame, step)
+        if len(frames) < 2:
+            return
+        rows, co, valid = self.get_marker_window(self.live.values(), frames)
+        
+        # mean motion (normalized [0-1]) distance for tracks between last and current frame
+        distance, both, mean = self.estimate_motion(co, valid)
+        tracked = both.any(axis=0)
+        if tracked.any():
+            self.motion = float(np.median(mean[tracked]))
         else:
+            self.motion = 0.0
+        deviation = np.where(both, np.abs(distance-mean[np.newaxis, :])/mean[np.newaxis, :], 0)
+        residual = deviation.sum(axis=1)/np.maximum(both.sum(axis=1), 1)
+        self.residuals = dict(zip([store.key(track) for track in rows], residual.tolist()))
+        
+        # how much a track is allowed to move 
+        allowed = mean * props.jump_cut
+        jumps = both & (distance > allowed[np.newaxis, :])
+        if props.outlier_mode == 'NEIGHBOURS':
+            self.neighbour_jumps(co, both, jumps)
+        
+        jumping = 0
+        for i in np.flatnonzero(jumps.any(axis=1)):
+            cols = np.flatnonzero(jumps[i])+1
+            split = [frames[cols[0]], frames[cols[-1]]]
+            self.split_track(rows[i], split[0], abs(split[0]-split[1]))
+            jumping += 1
+                    
+        self.profiler.count("cut", jumping)
+    
+    def neighbour_jumps(self, co, both, jumps):
+        """
+            replace global motion test in jumps by a comparison of each marker motion
+            with the median motion of its nearest neighbours on previous frame,
+            markers with less than 3 neighbours keep the global test
+            co, both : window arrays from get_marker_window and estimate_motion
+            jumps : (tracks x frames-1) mask updated in place
+        """
+        props = self.props
+        # tracker noise, prevents rigid motion from flagging every marker
+        min_scale = 1.0/self.clip.size[0]
+        for col in range(both.shape[1]):
+            rows = np.flatnonzero(both[:, col])
+            if len(rows) < 4:
+                continue
+            motion = co[rows, col+1]-co[rows, col]
+            nearest = knn_indices(co[rows, col], props.neighbours)
+            known = nearest >= 0
+            neighbour = np.where(known[:, :, np.newaxis], motion[nearest], np.nan)
+            median = np.nanmedian(neighbour, axis=1)
+            spread = np.sqrt(((neighbour-median[:, np.newaxis])**2).sum(axis=2))
+            # median absolute deviation, scaled to a standard deviation
+            mad = 1.4826*np.nanmedian(spread, axis=1)
+            residual = np.sqrt(((motion-median)**2).sum(axis=1))
+            enough = known.sum(axis=1) >= 3
+            jumps[rows[enough], col] = residual[enough] > props.jump_cut*np.maximum(mad[enough], min_scale)
+        
+    def cleanup_shot(self):
+        """
+            filter the whole shot at once, from columnar copies of all tracks markers:
+            split tracks where a marker jumps more than jump_cut times the mean motion of its frame,
+            then delete tracks shorter than small_tracks
+            return number of cut and deleted tracks
+        """
+        props = self.props
+        store = self.store
+        # tracking may have run since last cycle
+        store.invalidate()
+        # tracks locked or hidden by the user are left as they are
+        skip = lambda track: store.locked(track) or store.key(track) in self.dead or store.key(track) in self.user_hidden
+        rows = [track for track in store.tracks() if not skip(track)]
+        arrays = store.arrays(rows)
+        frames, co, mute = arrays.frames, arrays.co, arrays.mute
+        
+        # unmuted markers following an unmuted marker of the previous frame on the same track
+        owner = np.repeat(np.arange(len(rows)), np.diff(arrays.offsets))
+        pair = np.flatnonzero((owner[1:] == owner[:-1]) & (frames[1:]-frames[:-1] == 1) &
+            ~mute[1:] & ~mute[:-1])+1
+        distance = np.sqrt(((co[pair]-co[pair-1])**2).sum(axis=1))
+        
+        # mean motion per frame, skipping fixed tracks
+        cut = 0
+        if len(pair) > 0:
+            frame_min = frames[pair].min()
+            col = frames[pair]-frame_min
+            moving = distance > 0
+            nbtracks = np.bincount(col[moving], minlength=col.max()+1)
+            total = np.bincount(col[moving], weights=distance[moving], minlength=col.max()+1)
             # arbitrary set to prevent division by 0 error
-            mean = 10
+            mean = np.full(nbtracks.shape, 10.0)
+            mean[nbtracks > 0] = total[nbtracks > 0] / nbtracks[nbtracks > 0]
+            jumps = pair[distance > mean[col]*props.jump_cut]
+            
+            # split at every jump, later parts on new tracks
+            for i in np.unique(owner[jumps]):
+                parts = [rows[i]]
+                for split_frame in frames[jumps[owner[jumps] == i]].tolist():
+                    for part in reversed(parts):
+                        if store.find(part, split_frame) is not None:
+                            parts.append(self.split_track(part, split_frame, backwards=False))
+                            break
+                cut += 1
+        
+        # short tracks, whole shot is tracked so every track did end
+        to_delete = []
+        for track in store.tracks():
+            if skip(track):
+                continue
+            if len(store.frames(track)[0]) > 1 and self.find_track_length(track) < self.min_length:
+                to_delete.append(track)
+        self.delete_tracks(to_delete)
+        self.flush_deleted()
+        print("Clean up: cut %s tracks, deleted %s tracks" % (cut, len(to_delete)))
+        return cut, len(to_delete)
+    
+    def compact_tracks(self, tracks=None):
+        """
+            drop fragments with less than 2 unmuted markers or shorter than small_tracks
+            and trim muted markers beyond the first and last unmuted ones,
+            keeping the muted marker next to each end
+            tracks : tracks to compact, default to tracks no longer tracked,
+                     locked tracks and tracks hidden before autotracking are left as they are
+            return number of removed tracks, removed markers and estimated bytes reclaimed
+        """
+        store = self.store
+        if tracks is None:
+            # tracks no longer tracked never change again, compact them once
+            tracks = [track for track in store.tracks()
+                if not (store.key(track) in self.live or store.key(track) in self.compacted)]
+        tracks = [track for track in tracks
+            if not (store.locked(track) or store.key(track) in self.dead or store.key(track) in self.user_hidden)]
+        arrays = store.arrays(tracks)
+        
+        to_delete = []
+        removed = 0
+        for i, track in enumerate(tracks):
+            frames, co, mute = arrays.markers(i)
+            on = np.flatnonzero(~mute)
+            if len(on) < 2 or (self.min_length > 0 and frames[on[-1]]-frames[on[0]] < self.min_length):
+                to_delete.append(track)
+                removed += len(frames)
+                continue
+            # markers are sorted by frame
+            tail = np.concatenate((np.arange(on[0]-1), np.arange(on[-1]+2, len(frames))))
+            if len(tail) > 0:
+                store.delete_markers(track, sorted(frames[tail].tolist(), reverse=True))
+                self.summaries.invalidate(track)
+                removed += len(tail)
+        self.delete_tracks(to_delete)
+        self.compacted.update(store.key(track) for track in tracks)
+        reclaimed = len(to_delete)*TRACK_BYTES+removed*MARKER_BYTES
+        self.profiler.count("compacted_tracks", len(to_delete))
+        self.profiler.count("compacted_markers", removed)
+        print("Compact: removed %s tracks, %s markers, about %.1f kB" % (len(to_delete), removed, reclaimed/1024.0))
+        return len(to_delete), removed, reclaimed
+        
+    def refine(self, tracks, frame_a, frame_b):
+        """
+            move markers of tracks between frame_a and frame_b to full resolution positions
+            the last marker of each track is tracked at full resolution from its first one,
+            markers at frame_a are expected to be refined already, first markers after frame_a
+            are moved to the strongest full resolution corner around them,
+            markers in between get the correction interpolated along the track
+            return number of refined tracks
+        """
+        store = self.store
+        if frame_a == frame_b:
+            return 0
+        if frame_b > frame_a:
+            step = 1
+        else:
+            step = -1
+        radius = self.proxy_scale
+        
+        # group tracks by (first, last, corner) frames of their unmuted markers inside [frame_a, frame_b]
+        groups = collections.OrderedDict()
+        for track in tracks:
+            if store.hidden(track) or store.locked(track):
+                continue
+            frames = store.frames(track)[0]
+            inside = frames[((frames-frame_a)*step >= 0) & ((frame_b-frames)*step >= 0) & ~store.mute(track)]
+            if len(inside) < 2:
+                continue
+            if step > 0:
+                first, last = int(inside.min()), int(inside.max())
+            else:
+                first, last = int(inside.max()), int(inside.min())
+            groups.setdefault((first, last, first != frame_a), []).append(track)
+        
+        # markers are less than a proxy pixel off, enough levels to catch that at full resolution
+        levels = 1+int(math.log(self.proxy_scale, 2))
+        pyramids = self.refine_pyramids
+        def pyramid(frame):
+            if frame not in pyramids:
+                pixels = self.backend.frame_pixels(self.clip, frame)
+                pyramids[frame] = None if pixels is None else (pixels,
+                    build_pyramid(pixels, min(levels, pyramid_levels(pixels.shape))))
+            return pyramids[frame]
+        
+        refined = 0
+        for (first, last, corner), group in groups.items():
+            start, end = pyramid(first), pyramid(last)
+            if start is None or end is None:
+                continue
+            height, width = start[0].shape
+            size = np.array([width, height], dtype=np.float32)
+            a = np.array([store.co(track)[store.find(track, first)] for track in group])*size-0.5
+            b = np.array([store.co(track)[store.find(track, last)] for track in group])*size-0.5
+            a_refined = a.copy()
+            if corner:
+                for i, (x, y) in enumerate(a.tolist()):
+                    found = find_corner(start[0], max(0, int(x)-radius), max(0, int(y)-radius),
+                        min(width, int(x)+radius+1), min(height, int(y)+radius+1))
+                    if found is not None:
+                        a_refined[i] = found[1:]
+            b_refined, ok = klt_track(start[1], end[1], a_refined.astype(np.float32), guess=b-a)
+            
+            for i in np.flatnonzero(ok):
+                track = group[i]
+                frames, index = store.frames(track)
+                co = store.co(track).copy()
+                lo, hi = sorted((index[first], index[last]))
+                # correction at both ends in normalized coordinates, linear in between
+                ca = (a_refined[i]-a[i])/size
+                cb = (b_refined[i]-b[i])/size
+                t = (frames[lo:hi+1]-first)/float(last-first)
+                co[lo:hi+1] += ca+(cb-ca)*t[:, np.newaxis]
+                store.set_co(track, co)
+                refined += 1
+        # frame_b is frame_a of the next refine
+        for frame in list(pyramids):
+            if frame != frame_b:
+                del pyramids[frame]
+        return refined
+        
+    def refine_shot(self):
+        """
+            refine every track on keyframes frame_separation frames apart
+            return number of refined track segments
+        """
+        store = self.store
+        store.invalidate()
+        frame_start, frame_end, frame_duration = self.get_frame_range()
+        keyframes = list(range(frame_start, frame_end, self.props.frame_separation))+[frame_end]
+        tracks = list(store.tracks())
+        refined = 0
+        for frame_a, frame_b in zip(keyframes[:-1], keyframes[1:]):
+            refined += self.refine(tracks, frame_a, frame_b)
+        return refined
+        
+    def retire_finished(self):
+        """
+            remove from live tracks the ones ending before the current filter window,
+            later windows are further away so these tracks will never change again
+        """
+        scene, props, clip, store, current_frame, last_frame = self.get_vars()
+        if props.track_backwards:
+            step = -1
+        else:
+            step = 1
+        window_start = last_frame-step
+        finished = []
+        for key, track in self.live.items():
+            frames = store.frames(track)[0]
+            if store.hidden(track) or store.locked(track) or len(frames) == 0:
+                finished.append(key)
+                continue
+            # tracks with a single marker stay active, see get_active_tracks
+            if len(frames) < 2:
+                continue
+            if step > 0:
+                last = frames.max()
+            else:
+                last = frames.min()
+            if (last-window_start)*step < 0:
+                finished.append(key)
+        for key in finished:
+            del self.live[key]
+        self.profiler.count("retired", len(finished))
+        
+    def get_frame_range(self):
+        """
+            get tracking frames range
+            use clip limits when clip shorter than scene 
+            else use scene limits
+        """
+        scene, props, clip, store, current_frame, last_frame = self.get_vars()
+        frame_start = max(scene.frame_start, clip.frame_start)
+        frame_end = min(scene.frame_end, clip.frame_start+clip.frame_duration)
+        frame_duration = frame_end - frame_start
+        return frame_start, frame_end, frame_duration
+        
+    def clamp_current_frame(self):
+        """
+            move current frame inside tracking frames range and use it as start frame
+        """
+        scene = self.scene
+        frame_start, frame_end, frame_duration = self.get_frame_range()
+        
+        if scene.frame_current > frame_end:
+            scene.frame_current = frame_end
+        elif scene.frame_current < frame_start:
+            scene.frame_current = frame_start
+        
+        self.start_frame = scene.frame_current
+        
+    def measure_survival(self):
+        """
+            return ratio of tracks selected by last cycle still tracked on current frame
+        """
+        scene, props, clip, store, current_frame, last_frame = self.get_vars()
+        if len(self.last_active) == 0:
+            return 1.0
+        alive = 0
+        for key in self.last_active:
+            track = self.live.get(key)
+            if track is None or store.hidden(track) or store.locked(track):
+                continue
+            i = store.find(track, current_frame)
+            if (i is not None) and (not store.mute(track, i)):
+                alive += 1
+        return alive/float(len(self.last_active))
+        
+    def update_schedule(self, survival):
+        """
+            set separation from survival, motion and coverage measured by this cycle
+        """
+        props = self.props
+        if props.schedule == 'ADAPTIVE':
+            self.separation = self.scheduler.update(survival, self.motion, self.coverage,
+                props.coverage_target/100.0)
+        else:
+            self.separation = props.frame_separation
+        
+    def reached_end(self):
+        scene, props, clip, store, current_frame, last_frame = self.get_vars()
+        frame_start, frame_end, frame_duration = self.get_frame_range()
+        return (((not props.track_backwards) and current_frame >= frame_end) or
+            (props.track_backwards and current_frame <= frame_start))
+    
+    def prepare_cycle(self):
+        """
+            filter tracks, detect new features and select tracks to track
+            until next cycle, setting up frames_limit
+            return active tracks, empty when there is nothing left to track
+        """
+        # scene and settings do not change while the cycle is prepared
+        self.cycle_vars = None
+        self.cycle_vars = self.get_vars()
+        try:
+            return self.run_cycle_stages()
+        finally:
+            self.cycle_vars = None
+        
+    def run_cycle_stages(self):
+        scene, props, clip, store, current_frame, last_frame = self.get_vars()
+        
+        profiler = self.profiler
+        profiler.begin_cycle(current_frame)
+        self.cycles += 1
+        
+        # track_markers did run since last cycle, cached markers are stale
+        store.invalidate()
+        store.reset_stats()
+        
+        survival = self.measure_survival()
+        
+        # Remove bad tracks before adding new ones
+        if props.cycle_filter:
+            with profiler.stage("remove_small"):
+                self.remove_small()
+            with profiler.stage("remove_jumping"):
+                self.remove_jumping()
+        with profiler.stage("retire_finished"):
+            self.retire_finished()
+        
+        # move tracks followed on proxy frames to full resolution at keyframes
+        if self.proxy_scale > 1 and props.refine_every > 0 and self.cycles % props.refine_every == 0:
+            with profiler.stage("refine"):
+                profiler.count("refined", self.refine(list(self.live.values()), self.keyframe, current_frame))
+            self.keyframe = current_frame
+    
+        # add new tracks
+        with profiler.stage("auto_features"):
+            self.auto_features()
+
+        # remove deleted tracks in batches
+        # drop discarded fragments and muted tails of tracks no longer tracked
+        if props.compact_every > 0 and self.cycles % props.compact_every == 0:
+            with profiler.stage("compact"):
+                self.compact_tracks()
+
+        if props.delete_every > 0 and self.cycles % props.delete_every == 0:
+            with profiler.stage("flush_deleted"):
+                self.flush_deleted()
+
+        # keep tracking cost bounded
+        with profiler.stage("limit_active_tracks"):
+            self.limit_active_tracks()
+        
+        # Select active trackers for tracking
+        with profiler.stage("select_active_tracks"):
+            active_tracks = self.select_active_tracks()
+        profiler.count("cache_hits", store.hits)
+        profiler.count("cache_misses", store.misses)
+        self.last_active = set(store.key(track) for track in active_tracks)
+        
+        # frames to track until next cycle
+        self.update_schedule(survival)
+        profiler.count("separation", self.separation)
+        
+        if props.checkpoint_every > 0 and self.cycles % props.checkpoint_every == 0:
+            with profiler.stage("checkpoint"):
+                self.checkpoint(bpy.path.abspath(props.checkpoint_dir))
+        
+        # setup frame_limit on tracks
+        if len(active_tracks) > 0:
+            for track in active_tracks:
+                store.set_frames_limit(track, 0)
+            store.set_frames_limit(active_tracks[0], self.separation)
+        
+        # decode frames of next tracking step while waiting for it
+        if props.tracker == 'KLT' or props.detector == 'GRID':
+            if props.track_backwards:
+                step = -1
+            else:
+                step = 1
+            self.frame_cache().prefetch(range(current_frame+step, current_frame+step*(self.separation+1), step))
         
-        return mean
-    
-    # REMOVE SMALL TRACKS
-    def remove_small(self, context):
-        t = time.time()
-        scene, props, clip, tracks, current_frame, last_frame = self.get_vars_from_context(context)
-        to_delete = []
-        bpy.ops.clip.select_all(action='DESELECT')
-        for track in tracks:
-            if track.hide or track.lock:
-                continue
-            if len(track.markers) > 1:
-                marker = track.markers.find_frame(current_frame)
-                if marker is None and self.find_track_length(track) < props.small_tracks:
-                    to_delete.append(track)
-        deleted_tracks = len(to_delete)
-        self.delete_tracks(to_delete)
-        print("remove_small %.4f seconds %s tracks deleted." % (time.time()-t, deleted_tracks))
+        return active_tracks
     
-    def split_track(self, context, track, split_frame, skip=0):
-        scene, props, clip, tracks, current_frame, last_frame = self.get_vars_from_context(context)
-        if props.track_backwards:
-            end = scene.frame_start
-            step = -1
-        else:
-            end = scene.frame_end
-            step = 1
-        new_track = \
-            tracks.new(frame=split_frame)
-        for frame in range(split_frame, end, step):
-            marker = track.markers.find_frame(frame)
-            if marker is None:
-                return
-            # add new marker on new track for frame    
-            if abs(frame - split_frame) >= skip:    
-                new_marker = new_track.markers.find_frame(frame)
-                if new_marker is None:
-                    new_marker = new_track.markers.insert_frame(frame)
-                new_marker.co = marker.co
-            # remove marker on track for frame
-            if frame == split_frame:
-                track.hide = True
-            else:
-                track.markers.delete_frame(frame)
-            marker.mute = True
-                    
-    # REMOVE JUMPING MARKERS
-    def remove_jumping(self, context):
+    def checkpoint(self, dirpath):
+        """
+            save tracks and loop state to dirpath, incrementally:
+            tracks no longer live never change again, they are written once to done_NNNN.npz,
+            live tracks are rewritten to live.npz, state.json is written last
+        """
+        store = self.store
+        if not os.path.isdir(dirpath):
+            os.makedirs(dirpath)
+        done = [track for track in store.tracks()
+            if not (store.key(track) in self.live or store.key(track) in self.dead or
+                store.key(track) in self.saved)]
+        if len(done) > 0:
+            store.arrays(done).save(os.path.join(dirpath, "done_%04d.npz" % (self.chunks)))
+            self.saved.update((store.key(track), [store.name(track), self.chunks]) for track in done)
+            self.chunks += 1
+        store.arrays(self.live.values()).save(os.path.join(dirpath, "live.tmp"))
+        os.replace(os.path.join(dirpath, "live.tmp"), os.path.join(dirpath, "live.npz"))
+        state = {
+            "clip": self.clip.name,
+            "frame": self.scene.frame_current,
+            "start_frame": self.start_frame,
+            "track_backwards": self.props.track_backwards,
+            "cycles": self.cycles,
+            "separation": self.separation,
+            "interval": self.scheduler.interval,
+            "chunks": self.chunks,
+            "removed": self.removed,
+            "user_hidden": sorted(store.name(track) for track in store.tracks() if store.key(track) in self.user_hidden),
+            "finished": False,
+            }
+        self.write_state(dirpath, state)
+        self.profiler.count("checkpoint_tracks", len(done)+len(self.live))
         
-        t = time.time()
+    def write_state(self, dirpath, state):
+        with open(os.path.join(dirpath, "state.tmp"), "w") as f:
+            json.dump(state, f, sort_keys=True)
+        os.replace(os.path.join(dirpath, "state.tmp"), os.path.join(dirpath, "state.json"))
         
-        scene, props, clip, tracks, current_frame, last_frame = self.get_vars_from_context(context)
+    def read_state(self, dirpath):
+        """
+            return checkpoint state of this clip and direction saved to dirpath, None when there is none
+        """
+        path = os.path.join(dirpath, "state.json")
+        if not os.path.isfile(path):
+            return None
+        with open(path) as f:
+            state = json.load(f)
+        if state["clip"] != self.clip.name or state["track_backwards"] != self.props.track_backwards:
+            return None
+        return state
         
-        if props.track_backwards:
-            step = -1
-        else:
-            step = 1
+    def mark_finished(self, dirpath):
+        """
+            flag the checkpoint in dirpath as finished so it can not be resumed over final tracks
+        """
+        state = self.read_state(dirpath)
+        if state is not None and not state.get("finished", False):
+            state["finished"] = True
+            self.write_state(dirpath, state)
         
-        to_split = [None for track in tracks]
-        for frame in range(last_frame, current_frame, step):
-            
-            last = frame - step
-            
-            # mean motion (normalized [0-1]) distance for tracks between last and current frame
-            mean = self.estimate_motion(context, last, frame)
-            
-            # how much a track is allowed to move 
-            allowed = mean * props.jump_cut
+    def resume(self, dirpath):
+        """
+            restore clip tracks and loop state of the last checkpoint saved to dirpath
+            clip tracks are updated in place, keeping their settings (lock, pattern and search areas),
+            tracks missing from the clip are created, tracks not in the checkpoint are removed
+            return False when there is no unfinished checkpoint for this clip and direction
+        """
+        state = self.read_state(dirpath)
+        if state is None or state.get("finished", False):
+            return False
         
-            for i, track in enumerate(tracks):
-                if track.hide or track.lock:
+        store = self.store
+        store.invalidate()
+        removed = set((name, chunk) for name, chunk in state.get("removed", []))
+        existing = dict((store.name(track), track) for track in store.tracks())
+        self.summaries = TrackSummaries(store)
+        self.live.clear()
+        self.dead.clear()
+        self.saved.clear()
+        self.compacted.clear()
+        self.removed = [list(item) for item in removed]
+        files = ["done_%04d.npz" % (chunk) for chunk in range(state["chunks"])]+["live.npz"]
+        for chunk, filename in enumerate(files):
+            arrays = TrackArrays.load(os.path.join(dirpath, filename))
+            tracks = []
+            missing = []
+            for i in range(len(arrays)):
+                name = str(arrays.names[i])
+                if (name, chunk) in removed:
+                    continue
+                track = existing.pop(name, None)
+                if track is None:
+                    missing.append(i)
                     continue
-                marker0 = track.markers.find_frame(frame)
-                marker1 = track.markers.find_frame(last)
-                if marker0 is not None and marker1 is not None:
-                    distance = (marker0.co-marker1.co).length
-                    # Jump Cut threshold
-                    if distance > allowed:
-                        if to_split[i] is None:
-                            to_split[i] = [frame, frame]
-                        else:
-                            to_split[i][1] = frame 
+                frames, co, mute = arrays.markers(i)
+                old = store.frames(track)[0]
+                store.insert_markers(track, frames.tolist(), co.tolist(), mute.tolist())
+                store.delete_markers(track, sorted(np.setdiff1d(old, frames).tolist(), reverse=True))
+                store.set_hidden(track, bool(arrays.hide[i]))
+                tracks.append(track)
+            tracks.extend(store.add_arrays(arrays.subset(missing)))
+            for track in tracks:
+                if chunk < state["chunks"]:
+                    self.saved[store.key(track)] = [store.name(track), chunk]
+                else:
+                    self.live[store.key(track)] = track
+        store.remove(list(existing.values()))
+        user_hidden = set(state.get("user_hidden", []))
+        self.user_hidden.clear()
+        self.hidden.clear()
+        for track in store.tracks():
+            if store.hidden(track):
+                if store.name(track) in user_hidden:
+                    self.user_hidden.add(store.key(track))
+                else:
+                    self.hidden.add(store.key(track))
         
-        jumping = 0
-        for i, split in enumerate(to_split):
-            if split is not None:
-                self.split_track(context, tracks[i], split[0], abs(split[0]-split[1]))
-                jumping += 1
-                    
-        print("remove_jumping :%.4f seconds %s tracks cut." % (time.time()-t, jumping))  
-    
-    def get_frame_range(self, context):
+        self.scene.frame_current = state["frame"]
+        self.start_frame = state["start_frame"]
+        self.cycles = state["cycles"]
+        self.separation = state["separation"]
+        self.scheduler.interval = state["interval"]
+        self.chunks = state["chunks"]
+        print("Resumed at frame %s, %s tracks" % (state["frame"], len(store.tracks())))
+        return True
+        
+    def run(self):
         """
-            get tracking frames range
-            use clip limits when clip shorter than scene 
-            else use scene limits
+            autotrack until clip end synchronously
+            return number of cycles done
         """
-        scene, props, clip, tracks, current_frame, last_frame = self.get_vars_from_context(context)
-        frame_start = max(scene.frame_start, clip.frame_start)
-        frame_end = min(scene.frame_end, clip.frame_start+clip.frame_duration)
-        frame_duration = frame_end - frame_start
-        return frame_start, frame_end, frame_duration
+        cycles = 0
+        while not self.reached_end():
+            frame = self.scene.frame_current
+            if len(self.prepare_cycle()) == 0:
+                print("No new tracks created. Doing nothing.")
+                break
+            self.track_frames()
+            cycles += 1
+            # every track was lost on first tracked frame
+            if self.scene.frame_current == frame:
+                print("Tracking stopped at frame %s" % (frame))
+                break
+        self.finish()
+        return cycles
         
+class OP_Tracking_auto_tracker(Operator):
+    """Autotrack. Esc to cancel."""
+    bl_idname = "tracking.auto_track"
+    bl_label = "AutoTracking"
+
+    _timer = None
+    _draw_handler = None
+    
+    gl = GlDrawOnScreen()
+    progress = 0
+    limits = 0
+    t = 0
+    
     def modal(self, context, event):
         
         if event.type in {'ESC'}:
@@ -391,11 +2567,11 @@ class OP_Tracking_auto_tracker(Operator):
             self.cancel(context)
             return {'FINISHED'}
         
-        scene, props, clip, tracks, current_frame, last_frame = self.get_vars_from_context(context)
-        frame_start, frame_end, frame_duration = self.get_frame_range(context)
+        engine = self.engine
+        scene, props, clip, store, current_frame, last_frame = engine.get_vars()
+        frame_start, frame_end, frame_duration = engine.get_frame_range()
         
-        if (((not props.track_backwards) and current_frame >= frame_end) or
-            (props.track_backwards and current_frame <= frame_start)):
+        if engine.reached_end():
             print("Reached clip end")
             self.cancel(context)
             return {'FINISHED'}
@@ -403,34 +2579,25 @@ class OP_Tracking_auto_tracker(Operator):
         # dont run this modal while tracking operator runs
         # Known issue, youll have to keep ESC pressed
         if event.type not in {'TIMER'} or context.scene.frame_current != self.next_frame:
+            if event.type in {'TIMER'}:
+                engine.profiler.busy()
             return {'PASS_THROUGH'}
         
         # prevent own TIMER event while running
         self.stop_timer(context)
         
         if props.track_backwards:
-            self.next_frame = scene.frame_current - props.frame_separation
-            total = self.start_frame - frame_start
+            total = engine.start_frame - frame_start
         else:
-            self.next_frame = scene.frame_current + props.frame_separation
-            total = frame_end - self.start_frame
+            total = frame_end - engine.start_frame
         
         if total > 0:
-            self.progress = (current_frame-self.start_frame)/total
+            self.progress = (current_frame-engine.start_frame)/total
         else:
             self.progress = 0
-            
-        print("Tracking frame %s" % (scene.frame_current))
         
-        # Remove bad tracks before adding new ones
-        self.remove_small(context)
-        self.remove_jumping(context)
-    
-        # add new tracks
-        self.auto_features(context)
-
-        # Select active trackers for tracking
-        active_tracks = self.select_active_tracks(context)
+        # filter, detect and select active trackers for tracking
+        active_tracks = engine.prepare_cycle()
         
         # finish if there is nothing to track
         if len(active_tracks) == 0:
@@ -438,16 +2605,20 @@ class OP_Tracking_auto_tracker(Operator):
             self.cancel(context)
             return {'FINISHED'}
         
-        # setup frame_limit on tracks
-        for track in active_tracks:
-            track.frames_limit = 0
-        active_tracks[0].frames_limit = props.frame_separation
-        
-        # Forwards or backwards tracking
+        # the cycle did set how many frames to track
         if props.track_backwards:
-            self.track_frames_backward()
+            self.next_frame = scene.frame_current - engine.separation
         else:
-            self.track_frames_forward()
+            self.next_frame = scene.frame_current + engine.separation
+        
+        # Forwards or backwards tracking
+        if engine.track_frames(invoke=True):
+            # tracked synchronously, may have stopped before next_frame
+            if scene.frame_current == current_frame:
+                print("Tracking stopped at frame %s" % (current_frame))
+                self.cancel(context)
+                return {'FINISHED'}
+            self.next_frame = scene.frame_current
             
         # setup a timer to broadcast a TIMER event to force modal to re-run as fast as possible (not waiting for any mouse or keyboard event) 
         self.start_timer(context)
@@ -456,14 +2627,16 @@ class OP_Tracking_auto_tracker(Operator):
       
     def invoke(self, context, event):
         scene = context.scene
-        frame_start, frame_end, frame_duration = self.get_frame_range(context)
+        clip = context.area.spaces.active.clip
+        props = context.window_manager.autotracker_props
+        self.engine = AutotrackEngine(clip, props, scene, ClipEditorBackend())
+        self.engine.clamp_current_frame()
+        return self.start_modal(context)
         
-        if scene.frame_current > frame_end:
-            scene.frame_current = frame_end
-        elif scene.frame_current < frame_start:
-            scene.frame_current = frame_start
+    def start_modal(self, context):
+        scene = context.scene
+        frame_start, frame_end, frame_duration = self.engine.get_frame_range()
         
-        self.start_frame = scene.frame_current
         self.start = (scene.frame_current-frame_start) / (frame_duration)
         self.progress = 0
         
@@ -496,13 +2669,123 @@ class OP_Tracking_auto_tracker(Operator):
         
     def cancel(self, context):
         self.stop_timer(context)
-        self.show_tracks(context)  
+        self.engine.finish()
         bpy.types.SpaceClipEditor.draw_handler_remove(self._draw_handler, 'WINDOW')
     
     @classmethod
     def poll(cls, context):
         return (context.area.spaces.active.clip is not None) 
     
+class OP_Tracking_resume_auto_tracker(OP_Tracking_auto_tracker):
+    """Resume autotrack from last checkpoint. Esc to cancel."""
+    bl_idname = "tracking.auto_track_resume"
+    bl_label = "Resume AutoTracking"
+    
+    def invoke(self, context, event):
+        clip = context.area.spaces.active.clip
+        props = context.window_manager.autotracker_props
+        self.engine = AutotrackEngine(clip, props, context.scene, ClipEditorBackend())
+        if not self.engine.resume(bpy.path.abspath(props.checkpoint_dir)):
+            self.engine.finish()
+            self.report({'ERROR'}, "No unfinished checkpoint of this clip in %s" % (props.checkpoint_dir))
+            return {'CANCELLED'}
+        return self.start_modal(context)
+    
+class OP_Tracking_cleanup_shot(Operator):
+    """Split jumping tracks and delete short tracks over the whole shot"""
+    bl_idname = "tracking.autotrack_cleanup"
+    bl_label = "Clean up shot"
+    bl_options = {'UNDO'}
+    
+    def execute(self, context):
+        clip = context.area.spaces.active.clip
+        props = context.window_manager.autotracker_props
+        engine = AutotrackEngine(clip, props, context.scene, ClipEditorBackend())
+        cut, deleted = engine.cleanup_shot()
+        engine.finish()
+        self.report({'INFO'}, "Cut %s tracks, deleted %s tracks" % (cut, deleted))
+        return {'FINISHED'}
+    
+    @classmethod
+    def poll(cls, context):
+        return (context.area.spaces.active.clip is not None) 
+    
+class OP_Tracking_compact_tracks(Operator):
+    """Remove tracks without tracked markers or shorter than Minimum Track Length and trim disabled markers"""
+    bl_idname = "tracking.autotrack_compact"
+    bl_label = "Compact tracks"
+    bl_options = {'UNDO'}
+    
+    def execute(self, context):
+        clip = context.area.spaces.active.clip
+        props = context.window_manager.autotracker_props
+        engine = AutotrackEngine(clip, props, context.scene, ClipEditorBackend())
+        tracks, markers, reclaimed = engine.compact_tracks(list(engine.store.tracks()))
+        engine.finish()
+        self.report({'INFO'}, "Removed %s tracks, %s markers, about %.1f kB" % (tracks, markers, reclaimed/1024.0))
+        return {'FINISHED'}
+    
+    @classmethod
+    def poll(cls, context):
+        return (context.area.spaces.active.clip is not None) 
+    
+class OP_Tracking_refine_tracks(Operator):
+    """Move markers to full resolution positions on keyframes, after tracking on proxy frames"""
+    bl_idname = "tracking.autotrack_refine"
+    bl_label = "Refine tracks"
+    bl_options = {'UNDO'}
+    
+    def execute(self, context):
+        clip = context.area.spaces.active.clip
+        props = context.window_manager.autotracker_props
+        engine = AutotrackEngine(clip, props, context.scene, ClipEditorBackend())
+        refined = engine.refine_shot()
+        engine.finish()
+        self.report({'INFO'}, "Refined %s track segments" % (refined))
+        return {'FINISHED'}
+    
+    @classmethod
+    def poll(cls, context):
+        return (context.area.spaces.active.clip is not None) 
+    
+class OP_Tracking_export_tracks(Operator, ExportHelper):
+    """Save markers of every track to a .npz file"""
+    bl_idname = "tracking.autotrack_export"
+    bl_label = "Export Tracks"
+    
+    filename_ext = ".npz"
+    filter_glob = StringProperty(default="*.npz", options={'HIDDEN'})
+    
+    def execute(self, context):
+        clip = context.area.spaces.active.clip
+        arrays = TrackArrays.from_tracks(clip.tracking.tracks)
+        arrays.save(self.filepath)
+        self.report({'INFO'}, "Exported %s tracks, %s markers" % (len(arrays), len(arrays.frames)))
+        return {'FINISHED'}
+    
+    @classmethod
+    def poll(cls, context):
+        return (context.area.spaces.active.clip is not None) 
+    
+class OP_Tracking_import_tracks(Operator, ImportHelper):
+    """Add tracks saved by Export Tracks to the clip"""
+    bl_idname = "tracking.autotrack_import"
+    bl_label = "Import Tracks"
+    bl_options = {'UNDO'}
+    
+    filename_ext = ".npz"
+    filter_glob = StringProperty(default="*.npz", options={'HIDDEN'})
+    
+    def execute(self, context):
+        clip = context.area.spaces.active.clip
+        created = TrackArrays.load(self.filepath).to_tracks(clip)
+        self.report({'INFO'}, "Imported %s tracks" % (len(created)))
+        return {'FINISHED'}
+    
+    @classmethod
+    def poll(cls, context):
+        return (context.area.spaces.active.clip is not None) 
+    
 class AutotrackerSettings(PropertyGroup):
     """Create properties"""
     df_margin = FloatProperty(
@@ -556,6 +2839,42 @@ class AutotrackerSettings(PropertyGroup):
             max=100
             )
 
+    schedule = EnumProperty(
+            name="Schedule",
+            description="How often tracks are filtered and new features are generated",
+            items=[
+                ("FIXED", "Fixed", "Every Frame Separation frames", 1),
+                ("ADAPTIVE", "Adaptive", "Between min and max separation frames, depending on track survival, "
+                                         "motion and coverage, detection is skipped while coverage is above target", 2),
+                ]
+            )
+
+    min_separation = IntProperty(
+            name="Min Separation",
+            description="Shortest number of frames between two cycles in adaptive schedule.",
+            default=2,
+            min=1,
+            max=100
+            )
+
+    max_separation = IntProperty(
+            name="Max Separation",
+            description="Longest number of frames between two cycles in adaptive schedule.",
+            default=20,
+            min=1,
+            max=100
+            )
+
+    coverage_target = FloatProperty(
+            name="Coverage Target",
+            description="Skip feature detection while markers cover more than this part of the frame "
+                        "(adaptive schedule, cells are New Marker Threshold wide).",
+            subtype='PERCENTAGE',
+            default=40,
+            min=0,
+            max=100
+            )
+
     jump_cut = FloatProperty(
             name="Jump Cut",
             description="Distance how much a marker can travel before it is considered "
@@ -571,6 +2890,153 @@ class AutotrackerSettings(PropertyGroup):
             default=False
             )
 
+    outlier_mode = EnumProperty(
+            name="Jump Test",
+            description="How marker motion is compared to detect jumps",
+            items=[
+                ("MEAN", "Mean Motion", "Marker motion against Jump Threshold times the mean motion of the frame", 1),
+                ("NEIGHBOURS", "Neighbours", "Marker motion against the median motion of its nearest markers, "
+                                             "Jump Threshold times their median absolute deviation "
+                                             "(parallax, several moving objects)", 2),
+                ]
+            )
+
+    neighbours = IntProperty(
+            name="Neighbours",
+            description="Number of nearest markers a marker motion is compared to.",
+            default=8,
+            min=3,
+            max=64
+            )
+
+    max_active = IntProperty(
+            name="Max Active Tracks",
+            description="Most tracks tracked at once, lowest priority tracks (young, crowded, "
+                        "moving unlike others) are retired first (0 for no limit).",
+            default=0,
+            min=0,
+            max=100000
+            )
+
+    cycle_filter = BoolProperty(
+            name="Filter Every Cycle",
+            description="Remove short and jumping tracks while autotracking, "
+                        "otherwise clean up the whole shot once autotracking ends.",
+            default=True
+            )
+
+    checkpoint_every = IntProperty(
+            name="Checkpoint Every",
+            description="Save tracks and autotrack state every this number of cycles, "
+                        "so autotracking can be resumed (0 to disable).",
+            default=0,
+            min=0,
+            max=1000
+            )
+
+    checkpoint_dir = StringProperty(
+            name="Checkpoint Directory",
+            description="Directory checkpoints are saved to.",
+            subtype='DIR_PATH',
+            default="//autotrack_checkpoint"
+            )
+
+    compact_every = IntProperty(
+            name="Compact Every",
+            description="Remove tracks without tracked markers or shorter than Minimum Track Length "
+                        "and trim disabled markers of tracks no longer tracked every this number "
+                        "of cycles and when autotracking ends (0 to disable).",
+            default=0,
+            min=0,
+            max=1000
+            )
+
+    delete_every = IntProperty(
+            name="Delete Every",
+            description="Remove deleted tracks from the clip every this number of cycles "
+                        "(0 to remove them when autotracking ends).",
+            default=10,
+            min=0,
+            max=1000
+            )
+
+    proxy_scale = EnumProperty(
+            name="Proxy",
+            description="Frame size the built-in detector and tracker work on",
+            items=[
+                ("1", "Full", "Full resolution frames", 1),
+                ("2", "1/2", "Half size frames, markers are refined at full resolution on keyframes", 2),
+                ("4", "1/4", "Quarter size frames, markers are refined at full resolution on keyframes", 3),
+                ("8", "1/8", "Eighth size frames, markers are refined at full resolution on keyframes", 4),
+                ]
+            )
+
+    refine_every = IntProperty(
+            name="Refine Every",
+            description="Move markers tracked on proxy frames to full resolution on a keyframe every this number "
+                        "of cycles and when autotracking ends (0 to only refine with Refine tracks).",
+            default=5,
+            min=0,
+            max=1000
+            )
+
+    frame_cache_size = IntProperty(
+            name="Frame Cache",
+            description="Memory used to keep decoded frames for the built-in detector and tracker (MB).",
+            default=1024,
+            min=16,
+            max=65536
+            )
+
+    frame_cache_uint8 = BoolProperty(
+            name="8 Bit Frame Cache",
+            description="Keep cached frames as 8 bit values, 4 times smaller than floats, "
+                        "enough for 8 bit footage.",
+            default=False
+            )
+
+    frame_cache_dir = StringProperty(
+            name="Frame Cache Directory",
+            description="Keep cached frames in memory mapped files in a subdirectory of this directory, "
+                        "removed when autotracking ends, empty to keep them in memory.",
+            subtype='DIR_PATH',
+            default=""
+            )
+
+    metrics_path = StringProperty(
+            name="Metrics File",
+            description="Append per cycle stage timings and track counts to this file (JSON lines), empty to disable.",
+            subtype='FILE_PATH',
+            default=""
+            )
+
+    use_cprofile = BoolProperty(
+            name="Profile",
+            description="Profile autotrack stages with cProfile, stats are saved next to metrics file (.prof).",
+            default=False
+            )
+
+    detector = EnumProperty(
+            name="Detector",
+            description="Feature detection method",
+            items=[
+                ("BLENDER", "Detect Features", "Blender detect features operator over the whole frame, "
+                                               "features near existing markers are deleted", 1),
+                ("GRID", "Coverage Grid", "Built-in corner detector only searching grid cells without markers "
+                                          "(image sequences, whole frame placement)", 2),
+                ]
+            )
+
+    tracker = EnumProperty(
+            name="Tracker",
+            description="Frame to frame tracking method",
+            items=[
+                ("BLENDER", "Track Markers", "Blender track markers operator, marker by marker", 1),
+                ("KLT", "Built-in KLT", "Built-in pyramidal Lucas-Kanade tracker, all markers at once "
+                                        "(image sequences)", 2),
+                ]
+            )
+
     # Dropdown menu
     list_items = [
         ("FRAME", "Whole Frame", "", 1),
@@ -612,6 +3078,26 @@ class AutotrackerPanel(Panel):
         row = layout.row()
         row.prop(wm.autotracker_props, "track_backwards")
 
+        col = layout.column(align=True)
+        col.prop(wm.autotracker_props, "checkpoint_every")
+        col.prop(wm.autotracker_props, "checkpoint_dir", text="")
+        col.operator("tracking.auto_track_resume", text="Resume", icon='RECOVER_LAST')
+
+        row = layout.row()
+        row.prop(wm.autotracker_props, "tracker", text="")
+        col = layout.column(align=True)
+        # only the built-in detector and tracker work on proxy frames
+        built_in = wm.autotracker_props.tracker == 'KLT' or wm.autotracker_props.detector == 'GRID'
+        if built_in:
+            col.prop(wm.autotracker_props, "proxy_scale")
+        if built_in and wm.autotracker_props.proxy_scale != '1':
+            sub = col.row(align=True)
+            sub.prop(wm.autotracker_props, "refine_every")
+            sub.operator("tracking.autotrack_refine", text="Refine")
+        col.prop(wm.autotracker_props, "frame_cache_size")
+        col.prop(wm.autotracker_props, "frame_cache_uint8")
+        col.prop(wm.autotracker_props, "frame_cache_dir", text="")
+
         row = layout.row()
         col = layout.column(align=True)
         col.prop(wm.autotracker_props, "delete_threshold")
@@ -620,11 +3106,35 @@ class AutotrackerPanel(Panel):
         sub = col.row(align=True)
         sub.prop(wm.autotracker_props, "frame_separation", text="Frame Separation")
         sub = col.row(align=True)
+        sub.prop(wm.autotracker_props, "schedule", text="")
+        if wm.autotracker_props.schedule == 'ADAPTIVE':
+            sub = col.row(align=True)
+            sub.prop(wm.autotracker_props, "min_separation", text="Min")
+            sub.prop(wm.autotracker_props, "max_separation", text="Max")
+            sub = col.row(align=True)
+            sub.prop(wm.autotracker_props, "coverage_target")
+        sub = col.row(align=True)
         sub.prop(wm.autotracker_props, "jump_cut", text="Jump Threshold")
+        sub = col.row(align=True)
+        sub.prop(wm.autotracker_props, "outlier_mode", text="")
+        if wm.autotracker_props.outlier_mode == 'NEIGHBOURS':
+            sub.prop(wm.autotracker_props, "neighbours", text="")
+        sub = col.row(align=True)
+        sub.prop(wm.autotracker_props, "max_active")
+        sub = col.row(align=True)
+        sub.prop(wm.autotracker_props, "cycle_filter")
+        sub = col.row(align=True)
+        sub.prop(wm.autotracker_props, "delete_every")
+        sub = col.row(align=True)
+        sub.prop(wm.autotracker_props, "compact_every")
+        row = col.row(align=True)
+        row.operator("tracking.autotrack_cleanup", text="Clean up shot")
+        row.operator("tracking.autotrack_compact", text="Compact")
 
         row = layout.row()
         row.label(text="Detect Features Settings:")
         col = layout.column(align=True)
+        col.prop(wm.autotracker_props, "detector", text="")
         col.prop(wm.autotracker_props, "df_margin", text="Margin:")
         sub = col.row(align=True)
         sub.prop(wm.autotracker_props, "df_distance", text="Distance:")
@@ -636,8 +3146,437 @@ class AutotrackerPanel(Panel):
         col = layout.column(align=True)
         col.prop(wm.autotracker_props, "placement_list", text="")
 
+        row = layout.row()
+        row.label(text="Metrics:")
+        col = layout.column(align=True)
+        col.prop(wm.autotracker_props, "metrics_path", text="")
+        sub = col.row(align=True)
+        sub.prop(wm.autotracker_props, "use_cprofile")
+
+        row = layout.row(align=True)
+        row.operator("tracking.autotrack_export", text="Export", icon='EXPORT')
+        row.operator("tracking.autotrack_import", text="Import", icon='IMPORT')
+
         layout.separator()
                     
+def batch_autotrack(clip, settings=None, scene=None, backend=None, start_frame=None, filepath=None, resume=False, **overrides):
+    """
+        Autotrack a clip synchronously, without modal operator nor UI
+        for render farm use e.g. blender -b -P script.py
+        clip : MovieClip or path to a movie file / first image of a sequence
+        settings : AutotrackerSettings like object, default to window manager ones
+        scene : scene providing frame range and current frame, default to context scene
+        backend : detection / tracking provider, default to clip operators run
+                  through a clip editor found in screens
+        start_frame : frame to start tracking from, default to frame range start
+                      (end when tracking backwards)
+        filepath : save blend file there when done
+        resume : continue from the checkpoint in checkpoint_dir when there is one
+        overrides : settings values to use instead of settings ones e.g. frame_separation=10
+        return the engine
+    """
+    t = time.time()
+    if isinstance(clip, str):
+        clip = bpy.data.movieclips.load(clip)
+    if scene is None:
+        scene = bpy.context.scene
+    if settings is None:
+        settings = bpy.context.window_manager.autotracker_props
+    if len(overrides) > 0:
+        settings = SettingsOverride(settings, **overrides)
+    if backend is None:
+        backend = ClipEditorBackend.from_clip(clip, scene)
+        
+    engine = AutotrackEngine(clip, settings, scene, backend)
+    frame_start, frame_end, frame_duration = engine.get_frame_range()
+    if start_frame is None:
+        if settings.track_backwards:
+            start_frame = frame_end
+        else:
+            start_frame = frame_start
+    scene.frame_current = start_frame
+    engine.clamp_current_frame()
+    if resume:
+        engine.resume(bpy.path.abspath(settings.checkpoint_dir))
+    
+    cycles = engine.run()
+    print("batch_autotrack %.2f seconds %s cycles %s tracks" % (time.time()-t, cycles, len(clip.tracking.tracks)))
+    
+    if filepath is not None:
+        bpy.ops.wm.save_as_mainfile(filepath=filepath)
+    return engine
+    
+def settings_values(settings):
+    """
+        plain dict of settings values, picklable for worker processes
+    """
+    if isinstance(settings, SettingsOverride):
+        values = settings_values(settings.settings)
+        values.update((k, v) for k, v in vars(settings).items() if k != "settings")
+        return values
+    if hasattr(settings, "bl_rna"):
+        return dict((prop.identifier, getattr(settings, prop.identifier))
+            for prop in settings.bl_rna.properties if prop.identifier != "rna_type")
+    return dict((k, getattr(settings, k)) for k in dir(settings)
+        if not (k.startswith("_") or callable(getattr(settings, k))))
+    
+def dump_tracks(tracks):
+    """
+        tracks markers as plain data: list of [(frame, x, y, mute), ...] per track
+    """
+    dump = []
+    for track in tracks:
+        n = len(track.markers)
+        frames = np.empty(n, dtype=np.int32)
+        co = np.empty(2*n, dtype=np.float32)
+        mute = np.empty(n, dtype=bool)
+        track.markers.foreach_get("frame", frames)
+        track.markers.foreach_get("co", co)
+        track.markers.foreach_get("mute", mute)
+        dump.append(list(zip(frames.tolist(), co[0::2].tolist(), co[1::2].tolist(), mute.tolist())))
+    return dump
+    
+class TrackArrays():
+    """
+        columnar copy of tracks markers, to save, load and process tracks outside of Blender
+        markers of track i are rows offsets[i]:offsets[i+1] of
+        frames (int32), co (float32, markers x 2, normalized) and mute (bool)
+        names, hide : one entry per track
+    """
+    def __init__(self, names, hide, offsets, frames, co, mute):
+        self.names = names
+        self.hide = hide
+        self.offsets = offsets
+        self.frames = frames
+        self.co = co
+        self.mute = mute
+        
+    def __len__(self):
+        return len(self.names)
+        
+    @classmethod
+    def from_tracks(cls, tracks):
+        """
+            copy markers of tracks with one bulk read per track and attribute
+        """
+        tracks = list(tracks)
+        counts = np.array([len(track.markers) for track in tracks], dtype=np.int64)
+        offsets = np.zeros(len(tracks)+1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        frames = np.empty(offsets[-1], dtype=np.int32)
+        co = np.empty((offsets[-1], 2), dtype=np.float32)
+        mute = np.empty(offsets[-1], dtype=bool)
+        for i, track in enumerate(tracks):
+            start, end = offsets[i], offsets[i+1]
+            track.markers.foreach_get("frame", frames[start:end])
+            track.markers.foreach_get("co", co[start:end].reshape(-1))
+            track.markers.foreach_get("mute", mute[start:end])
+        names = np.array([track.name for track in tracks], dtype=np.str_)
+        hide = np.array([track.hide for track in tracks], dtype=bool)
+        return cls(names, hide, offsets, frames, co, mute)
+        
+    def markers(self, i):
+        """
+            return frames, co and mute array views of track i
+        """
+        start, end = self.offsets[i], self.offsets[i+1]
+        return self.frames[start:end], self.co[start:end], self.mute[start:end]
+        
+    def subset(self, rows):
+        """
+            return TrackArrays of tracks at rows
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        counts = self.offsets[rows+1]-self.offsets[rows]
+        offsets = np.zeros(len(rows)+1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        markers = np.concatenate([np.arange(self.offsets[i], self.offsets[i+1]) for i in rows.tolist()]
+            + [np.empty(0, dtype=np.int64)])
+        return TrackArrays(self.names[rows], self.hide[rows], offsets, self.frames[markers],
+            self.co[markers], self.mute[markers])
+        
+    def to_tracks(self, clip):
+        """
+            create tracks in clip, return created tracks
+        """
+        tracks = clip.tracking.tracks
+        created = []
+        for i in range(len(self)):
+            frames, co, mute = self.markers(i)
+            if len(frames) == 0:
+                continue
+            track = tracks.new(name=str(self.names[i]), frame=int(frames[0]))
+            for frame in frames[1:].tolist():
+                track.markers.insert_frame(frame)
+            # markers are sorted by frame, like arrays rows
+            order = np.argsort(frames, kind="mergesort")
+            track.markers.foreach_set("co", co[order].reshape(-1))
+            track.markers.foreach_set("mute", mute[order])
+            track.hide = bool(self.hide[i])
+            created.append(track)
+        return created
+        
+    def save(self, filepath):
+        """
+            write arrays to an uncompressed .npz file
+        """
+        with open(filepath, "wb") as f:
+            np.savez(f, names=self.names, hide=self.hide, offsets=self.offsets,
+                frames=self.frames, co=self.co, mute=self.mute)
+        
+    @classmethod
+    def load(cls, filepath):
+        """
+            read every array of a file written by save
+        """
+        with np.load(filepath) as data:
+            return cls(data["names"], data["hide"], data["offsets"], data["frames"], data["co"], data["mute"])
+    
+def cleanup_dump(clip, settings, scene, dump):
+    """
+        cleanup_shot, then compact_tracks when compact_every is set, on dump_tracks data,
+        in an ArrayTrackStore so clip tracks are left alone
+        return TrackArrays of kept tracks
+    """
+    store = ArrayTrackStore()
+    for markers in dump:
+        if len(markers) == 0:
+            continue
+        frames, x, y, mute = zip(*markers)
+        store.add_record("Track.%03d" % (len(store.records)), np.array(frames, dtype=np.int32),
+            np.array(list(zip(x, y)), dtype=np.float32), np.array(mute, dtype=bool))
+    engine = AutotrackEngine(clip, settings, scene, ClipEditorBackend(), store)
+    engine.cleanup_shot()
+    # whole shot is tracked, every track is finished
+    if settings.compact_every > 0:
+        engine.compact_tracks(list(store.tracks()))
+    engine.finish()
+    return store.arrays(store.tracks())
+    
+def split_frame_range(frame_start, frame_end, segments, overlap):
+    """
+        split frame_start..frame_end into segments sharing overlap frames
+        return list of (start, end)
+    """
+    length = frame_end-frame_start
+    segments = max(1, min(segments, length // max(1, 2*overlap)))
+    bounds = [frame_start+(length*i) // segments for i in range(segments+1)]
+    return [(max(frame_start, bounds[i]-overlap), bounds[i+1]) for i in range(segments)]
+    
+def stitch_segments(dumps, threshold):
+    """
+        merge tracks of consecutive segments
+        a track of a segment continues a track of the previous one when their
+        unmuted markers on the frames they share are closer than threshold on average
+        dumps : dump_tracks data of each segment, in frame order
+        return merged dump
+    """
+    merged = [dict((m[0], m) for m in markers) for markers in dumps[0]]
+    for dump in dumps[1:]:
+        # index previous tracks by frame on frames of this segment only
+        frames = set(m[0] for markers in dump for m in markers)
+        by_frame = {}
+        for i, markers in enumerate(merged):
+            for frame, x, y, mute in markers.values():
+                if frame in frames and not mute:
+                    by_frame.setdefault(frame, SpatialGrid(threshold)).insert((x, y), i)
+        used = set()
+        for markers in dump:
+            candidates = set()
+            for frame, x, y, mute in markers:
+                grid = by_frame.get(frame)
+                if mute or grid is None:
+                    continue
+                cx, cy = grid.cell((x, y))
+                for ci in range(cx-1, cx+2):
+                    for cj in range(cy-1, cy+2):
+                        candidates.update(pt[2] for pt in grid.cells.get((ci, cj), ()))
+            best, best_distance = None, threshold
+            for i in candidates - used:
+                shared = [(m, merged[i][m[0]]) for m in markers
+                    if m[0] in merged[i] and not (m[3] or merged[i][m[0]][3])]
+                if len(shared) == 0:
+                    continue
+                distance = sum(math.hypot(a[1]-b[1], a[2]-b[2]) for a, b in shared) / len(shared)
+                if distance < best_distance:
+                    best, best_distance = i, distance
+            if best is None:
+                merged.append(dict((m[0], m) for m in markers))
+            else:
+                used.add(best)
+                for m in markers:
+                    merged[best].setdefault(m[0], m)
+    return [sorted(markers.values()) for markers in merged]
+    
+class ForkedClipSetup():
+    """
+        worker setup for fork started worker processes:
+        find clip and scene in the inherited blend data and use clip operators
+    """
+    def __init__(self, clip, scene):
+        self.clip_name = clip.name
+        self.scene_name = scene.name
+    def __call__(self):
+        clip = bpy.data.movieclips[self.clip_name]
+        scene = bpy.data.scenes[self.scene_name]
+        return clip, scene, ClipEditorBackend.from_clip(clip, scene)
+    
+def autotrack_segment(setup, values, frame_start, frame_end):
+    """
+        worker process entry, autotrack frame_start..frame_end
+        setup : picklable callable returning (clip, scene, backend)
+        values : settings_values dict, checkpoints are disabled and the metrics file
+                 gets a _<frame_start>_<frame_end> suffix
+        return dump_tracks data of tracks created in the segment
+    """
+    clip, scene, backend = setup()
+    # tracks are stitched or joined with other segments, compacted and pruned by length once merged,
+    # segments run at the same time so they neither share the checkpoint nor the metrics files
+    values = dict(values, compact_every=0, checkpoint_every=0)
+    if values.get("metrics_path"):
+        root, ext = os.path.splitext(bpy.path.abspath(values["metrics_path"]))
+        values["metrics_path"] = "%s_%d_%d%s" % (root, frame_start, frame_end, ext)
+    settings = SettingsOverride(None, **values)
+    existing = set(track.as_pointer() for track in clip.tracking.tracks)
+    scene.frame_start = frame_start
+    scene.frame_end = frame_end
+    if settings.track_backwards:
+        scene.frame_current = frame_end
+    else:
+        scene.frame_current = frame_start
+    engine = AutotrackEngine(clip, settings, scene, backend)
+    engine.min_length = 0
+    engine.clamp_current_frame()
+    engine.run()
+    return dump_tracks([track for track in clip.tracking.tracks if track.as_pointer() not in existing])
+    
+def parallel_autotrack(clip, settings=None, scene=None, setup=None, workers=None, overlap=None, filepath=None, **overrides):
+    """
+        Autotrack overlapping segments of the frame range in worker processes,
+        then stitch tracks meeting in the overlaps and add them to clip
+        clip, settings, scene, filepath, overrides : see batch_autotrack
+        setup : picklable callable run in workers returning (clip, scene, backend),
+                default to ForkedClipSetup, that needs fork started processes (linux)
+        workers : number of processes, default to cpu count
+        overlap : frames shared by consecutive segments, default to 2 * frame_separation
+        return created tracks
+    """
+    t = time.time()
+    if isinstance(clip, str):
+        clip = bpy.data.movieclips.load(clip)
+    if scene is None:
+        scene = bpy.context.scene
+    if settings is None:
+        settings = bpy.context.window_manager.autotracker_props
+    if len(overrides) > 0:
+        settings = SettingsOverride(settings, **overrides)
+    if setup is None:
+        setup = ForkedClipSetup(clip, scene)
+    if workers is None:
+        workers = os.cpu_count()
+    if overlap is None:
+        overlap = 2*settings.frame_separation
+        
+    frame_start = max(scene.frame_start, clip.frame_start)
+    frame_end = min(scene.frame_end, clip.frame_start+clip.frame_duration)
+    segments = split_frame_range(frame_start, frame_end, workers, overlap)
+    values = settings_values(settings)
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(autotrack_segment, setup, values, start, end) for start, end in segments]
+        dumps = [future.result() for future in futures]
+        
+    merged = stitch_segments(dumps, float(settings.delete_threshold)/100.0)
+    # fragments meeting at segment bounds are only filtered once stitched
+    created = cleanup_dump(clip, settings, scene, merged).to_tracks(clip)
+    print("parallel_autotrack %.2f seconds %s segments %s tracks (%s stitched, %s before stitching)" % (
+        time.time()-t, len(segments), len(created), len(merged), sum(len(dump) for dump in dumps)))
+    
+    if filepath is not None:
+        bpy.ops.wm.save_as_mainfile(filepath=filepath)
+    return created
+    
+def join_at_frame(forward, backward, frame, threshold):
+    """
+        merge tracks of a forward and a backward pass started on the same frame
+        a forward track continues a backward track when both have an unmuted marker
+        on frame closer than threshold, nearest pairs first
+        forward, backward : dump_tracks data of each pass
+        return merged dump, forward marker is kept on frame
+    """
+    grid = SpatialGrid(threshold)
+    for i, markers in enumerate(backward):
+        for f, x, y, mute in markers:
+            if f == frame and not mute:
+                grid.insert((x, y), i)
+    pairs = []
+    for i, markers in enumerate(forward):
+        for f, x, y, mute in markers:
+            if f == frame and not mute:
+                cx, cy = grid.cell((x, y))
+                for ci in range(cx-1, cx+2):
+                    for cj in range(cy-1, cy+2):
+                        pairs.extend((math.hypot(bx-x, by-y), i, j) for bx, by, j in grid.cells.get((ci, cj), ()))
+    pairs.sort()
+    joined = {}
+    used = set()
+    for distance, i, j in pairs:
+        if distance < threshold and i not in joined and j not in used:
+            joined[i] = j
+            used.add(j)
+    merged = []
+    for i, markers in enumerate(forward):
+        if i in joined:
+            markers = dict((m[0], m) for m in backward[joined[i]])
+            markers.update((m[0], m) for m in forward[i])
+            markers = sorted(markers.values())
+        merged.append(markers)
+    merged.extend(markers for j, markers in enumerate(backward) if j not in used)
+    return merged
+    
+def bidirectional_autotrack(clip, settings=None, scene=None, setup=None, start_frame=None, filepath=None, **overrides):
+    """
+        Autotrack forwards and backwards from start_frame at the same time
+        in two worker processes, then join tracks sharing their marker on start_frame
+        clip, settings, scene, filepath, overrides : see batch_autotrack
+        setup : see parallel_autotrack
+        start_frame : frame both passes start from, default to scene current frame
+        return created tracks
+    """
+    t = time.time()
+    if isinstance(clip, str):
+        clip = bpy.data.movieclips.load(clip)
+    if scene is None:
+        scene = bpy.context.scene
+    if settings is None:
+        settings = bpy.context.window_manager.autotracker_props
+    if len(overrides) > 0:
+        settings = SettingsOverride(settings, **overrides)
+    if setup is None:
+        setup = ForkedClipSetup(clip, scene)
+        
+    frame_start = max(scene.frame_start, clip.frame_start)
+    frame_end = min(scene.frame_end, clip.frame_start+clip.frame_duration)
+    if start_frame is None:
+        start_frame = scene.frame_current
+    start_frame = min(max(start_frame, frame_start), frame_end)
+    forward = settings_values(settings)
+    forward["track_backwards"] = False
+    backward = dict(forward, track_backwards=True)
+    with concurrent.futures.ProcessPoolExecutor(2) as pool:
+        forward_future = pool.submit(autotrack_segment, setup, forward, start_frame, frame_end)
+        backward_future = pool.submit(autotrack_segment, setup, backward, frame_start, start_frame)
+        dumps = [forward_future.result(), backward_future.result()]
+        
+    # both passes detect the same features on start_frame, allow for float precision only
+    merged = join_at_frame(dumps[0], dumps[1], start_frame, 0.5/clip.size[0])
+    created = cleanup_dump(clip, settings, scene, merged).to_tracks(clip)
+    print("bidirectional_autotrack %.2f seconds %s tracks (%s forwards, %s backwards)" % (
+        time.time()-t, len(created), len(dumps[0]), len(dumps[1])))
+    
+    if filepath is not None:
+        bpy.ops.wm.save_as_mainfile(filepath=filepath)
+    return created
+    
 def register():
     bpy.utils.register_class(AutotrackerSettings)
     WindowManager.autotracker_props = \
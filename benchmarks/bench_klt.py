@@ -0,0 +1,66 @@
+"""
+    Accuracy and speed of the built-in KLT tracker on a synthetic panning sequence
+
+    python benchmarks/bench_klt.py --points 100 1000 --frames 20
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fake_bpy
+fake_bpy.install()
+
+import autotracker
+import synthetic
+
+
+def bench_klt(points, frames, motion, image_size, levels=4, seed=0):
+    """
+        track points frame to frame along the known texture motion
+        return markers per second, mean error in pixels and ratio of points tracked to the end
+    """
+    clip, scene = synthetic.make_clip(0, frames+1)
+    backend = synthetic.FakeBackend(clip, scene, motion=motion, image_size=image_size, seed=seed)
+    width, height = image_size
+    rnd = np.random.RandomState(seed)
+    margin = 20
+    start = (rnd.rand(points, 2)*[width-2*margin, height-2*margin]+margin).astype(np.float32)
+    positions = start.copy()
+    alive = np.ones(points, dtype=bool)
+    pyramids = [autotracker.build_pyramid(backend.frame_pixels(clip, frame), levels)
+        for frame in range(1, frames+2)]
+    tracked = 0
+    t = time.perf_counter()
+    for i in range(frames):
+        positions[alive], ok = autotracker.klt_track(pyramids[i], pyramids[i+1], positions[alive])
+        tracked += len(ok)
+        alive[np.flatnonzero(alive)[~ok]] = False
+    elapsed = time.perf_counter()-t
+    # texture moves left by motion * width pixels per frame
+    expected = start+[-motion*width*frames, 0]
+    error = np.abs(positions[alive]-expected[alive]).mean() if alive.any() else float("nan")
+    return tracked/elapsed, error, alive.mean()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--points", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--frames", type=int, default=20)
+    parser.add_argument("--motion", type=float, default=0.004, help="motion per frame, relative to width")
+    parser.add_argument("--size", type=int, nargs=2, default=[960, 540])
+    args = parser.parse_args()
+
+    print("%8s %14s %12s %10s" % ("points", "markers/s", "error px", "tracked"))
+    for points in args.points:
+        rate, error, ratio = bench_klt(points, args.frames, args.motion, tuple(args.size))
+        print("%8s %14.0f %12.4f %10.2f" % (points, rate, error, ratio))
+
+
+if __name__ == "__main__":
+    main()
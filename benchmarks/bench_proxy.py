@@ -0,0 +1,75 @@
+"""
+    Whole autotrack runs with the built-in detector and tracker at each proxy size
+
+    python benchmarks/bench_proxy.py --frames 100 --size 960 540
+    python benchmarks/bench_proxy.py --frames 60 --size 1920 1080 --refine 5
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fake_bpy
+fake_bpy.install()
+
+import autotracker
+import synthetic
+
+
+def bench_proxy(proxy_scale, refine_every, frames, image_size, seed=0):
+    """
+        autotrack a synthetic panning clip
+        return seconds, number of tracks, mean track length in frames
+        and median distance in pixels between markers and the known motion
+    """
+    clip, scene = synthetic.make_clip(0, frames, seed=seed)
+    backend = synthetic.FakeBackend(clip, scene, seed=seed, image_size=image_size)
+    settings = synthetic.settings(tracker='KLT', detector='GRID', proxy_scale=proxy_scale,
+        refine_every=refine_every)
+    t = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        autotracker.batch_autotrack(clip, settings, scene, backend)
+    elapsed = time.perf_counter()-t
+    arrays = autotracker.TrackArrays.from_tracks(clip.tracking.tracks)
+    lengths = []
+    errors = []
+    for i in range(len(arrays)):
+        frames, co, mute = arrays.markers(i)
+        frames, co = frames[~mute], co[~mute]
+        if len(frames) == 0:
+            continue
+        lengths.append(frames[-1]-frames[0]+1)
+        # texture moves left by motion * width pixels per frame
+        expected = co[0, 0]-backend.motion*(frames-frames[0])
+        errors.append(np.abs(co[:, 0]-expected)*image_size[0])
+    error = np.median(np.concatenate(errors)) if len(errors) > 0 else float("nan")
+    return elapsed, len(arrays), np.mean(lengths) if len(lengths) > 0 else 0.0, error
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--size", type=int, nargs=2, default=[960, 540])
+    parser.add_argument("--scales", nargs="+", default=["1", "2", "4", "8"])
+    parser.add_argument("--refine", type=int, nargs="+", default=[5, 1, 0],
+        help="Refine Every values, 5 is the default")
+    args = parser.parse_args()
+
+    print("%6s %8s %10s %8s %10s %10s" % ("proxy", "refine", "seconds", "tracks", "length", "error px"))
+    for scale in args.scales:
+        # full resolution markers are never refined
+        for refine_every in args.refine if scale != "1" else [0]:
+            elapsed, tracks, length, error = bench_proxy(scale, refine_every, args.frames, tuple(args.size))
+            print("%6s %8s %10.2f %8s %10.1f %10.3f" % (scale, refine_every if scale != "1" else "-", elapsed,
+                tracks, length, error))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+    Time and memory of autotrack stages on synthetic clips, without Blender
+
+    python benchmarks/bench_stages.py --tracks 100 1000 --frames 200 1000
+    python benchmarks/bench_stages.py --stages --frames 1000 --parallel 2 4
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fake_bpy
+fake_bpy.install()
+
+import autotracker
+import synthetic
+
+STAGES = ("remove_small", "remove_jumping", "auto_features", "select_active_tracks")
+
+
+def make_engine(tracks, frames, outliers, seed, **overrides):
+    clip, scene = synthetic.make_clip(tracks, frames, outliers=outliers, seed=seed)
+    scene.frame_current = frames // 2
+    backend = synthetic.FakeBackend(clip, scene, seed=seed)
+    return autotracker.AutotrackEngine(clip, synthetic.settings(**overrides), scene, backend)
+
+
+def bench_stage(stage, tracks, frames, outliers, repeat, **overrides):
+    """
+        return best time in seconds of a first stage call and of a next cycle one,
+        after the store was invalidated like each cycle does, and peak python memory
+        in bytes of one stage call
+    """
+    best = None
+    warm = None
+    for i in range(repeat):
+        engine = make_engine(tracks, frames, outliers, i, **overrides)
+        t = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            getattr(engine, stage)()
+        elapsed = time.perf_counter()-t
+        if best is None or elapsed < best:
+            best = elapsed
+        engine.store.invalidate()
+        t = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            getattr(engine, stage)()
+        elapsed = time.perf_counter()-t
+        if warm is None or elapsed < warm:
+            warm = elapsed
+    engine = make_engine(tracks, frames, outliers, 0, **overrides)
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        getattr(engine, stage)()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, warm, peak
+
+
+def bench_run(frames, count, **overrides):
+    """
+        whole autotrack of an empty clip
+        return seconds, cycles and tracks
+    """
+    clip, scene = synthetic.make_clip(0, frames)
+    backend = synthetic.FakeBackend(clip, scene, count=count)
+    t = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        engine = autotracker.batch_autotrack(clip, synthetic.settings(**overrides), scene, backend)
+    return time.perf_counter()-t, len(engine.profiler.records), len(clip.tracking.tracks)
+
+
+def bench_parallel(frames, workers, seed=0):
+    """
+        whole autotrack of an empty clip through clip operators, serial when workers is 0,
+        else with parallel_autotrack over workers processes
+        return seconds, tracks and mean track length of unmuted markers
+    """
+    clip, scene = synthetic.make_clip(0, frames, seed=seed)
+    clip.name = "parallel_%s_%s" % (frames, workers)
+    synthetic.install_clip_editor(clip, scene, seed=seed)
+    settings = synthetic.settings()
+    t = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if workers == 0:
+            autotracker.batch_autotrack(clip, settings, scene)
+            tracks = list(clip.tracking.tracks)
+        else:
+            tracks = autotracker.parallel_autotrack(clip, settings, scene, workers=workers)
+    elapsed = time.perf_counter()-t
+    arrays = autotracker.TrackArrays.from_tracks(tracks)
+    lengths = []
+    for i in range(len(arrays)):
+        frames, co, mute = arrays.markers(i)
+        frames = frames[~mute]
+        lengths.append(int(frames.max()-frames.min()) if len(frames) > 0 else 0)
+    return elapsed, len(tracks), sum(lengths)/float(max(1, len(lengths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--tracks", type=int, nargs="+", default=[100, 500, 2000])
+    parser.add_argument("--frames", type=int, nargs="+", default=[200, 1000])
+    parser.add_argument("--outliers", type=float, default=0.01)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--stages", nargs="*", default=list(STAGES), choices=STAGES,
+        help="stages to time, none to only run --run or --parallel")
+    parser.add_argument("--run", action="store_true", help="also time whole autotrack runs")
+    parser.add_argument("--detector", default="BLENDER", choices=("BLENDER", "GRID"))
+    parser.add_argument("--parallel", type=int, nargs="*",
+        help="also compare a serial run with parallel_autotrack over these numbers of workers")
+    args = parser.parse_args()
+    overrides = dict(detector=args.detector)
+
+    if args.stages:
+        print("%-22s %7s %7s %12s %12s %12s" % ("stage", "tracks", "frames", "ms", "next ms", "peak KiB"))
+    for frames in args.frames:
+        for tracks in args.tracks:
+            for stage in args.stages:
+                elapsed, warm, peak = bench_stage(stage, tracks, frames, args.outliers, args.repeat, **overrides)
+                print("%-22s %7s %7s %12.2f %12.2f %12.1f" % (stage, tracks, frames, 1000*elapsed,
+                    1000*warm, peak/1024.0))
+
+    if args.run:
+        print("\n%-22s %7s %7s %12s %12s" % ("run", "cycles", "frames", "ms/cycle", "tracks"))
+        for frames in args.frames:
+            elapsed, cycles, tracks = bench_run(frames, 50, **overrides)
+            print("%-22s %7s %7s %12.2f %12s" % ("batch_autotrack", cycles, frames,
+                1000*elapsed/max(1, cycles), tracks))
+
+    if args.parallel:
+        print("\n%-22s %7s %7s %12s %12s %12s" % ("run", "workers", "frames", "seconds", "tracks", "mean length"))
+        for frames in args.frames:
+            for workers in [0]+args.parallel:
+                elapsed, tracks, length = bench_parallel(frames, workers)
+                print("%-22s %7s %7s %12.2f %12s %12.1f" % (
+                    "parallel_autotrack" if workers > 0 else "batch_autotrack", workers, frames, elapsed, tracks, length))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+    Stand-in for the bpy API surface used by the autotracker add-on,
+    so the add-on can be imported and its stages run outside of Blender.
+    install() must be called before importing autotracker.
+"""
+import bisect
+import math
+import sys
+import types
+
+
+class Vector():
+    def __init__(self, seq=(0.0, 0.0)):
+        self._v = [float(v) for v in seq]
+    def __getitem__(self, i):
+        return self._v[i]
+    def __setitem__(self, i, value):
+        self._v[i] = float(value)
+    def __len__(self):
+        return len(self._v)
+    def __iter__(self):
+        return iter(self._v)
+    def __sub__(self, other):
+        return Vector([a-b for a, b in zip(self._v, other)])
+    def __add__(self, other):
+        return Vector([a+b for a, b in zip(self._v, other)])
+    def __repr__(self):
+        return "Vector(%s)" % (self._v,)
+    @property
+    def length(self):
+        return math.sqrt(sum(a*a for a in self._v))
+    def copy(self):
+        return Vector(self._v)
+
+
+class Marker():
+    def __init__(self, frame, co=(0.0, 0.0)):
+        self.frame = frame
+        self._co = Vector(co)
+        self.mute = False
+    @property
+    def co(self):
+        return self._co
+    @co.setter
+    def co(self, value):
+        self._co = Vector(value)
+
+
+class Markers():
+    """
+        markers sorted by frame, like MovieTrackingMarkers
+    """
+    def __init__(self):
+        self._markers = []
+        self._frames = []
+    def __len__(self):
+        return len(self._markers)
+    def __iter__(self):
+        return iter(list(self._markers))
+    def __reversed__(self):
+        return reversed(list(self._markers))
+    def __getitem__(self, i):
+        return self._markers[i]
+    def find_frame(self, frame, exact=True):
+        i = bisect.bisect_left(self._frames, frame)
+        if i < len(self._frames) and self._frames[i] == frame:
+            return self._markers[i]
+        return None
+    def insert_frame(self, frame, co=(0.0, 0.0)):
+        i = bisect.bisect_left(self._frames, frame)
+        marker = Marker(frame, co)
+        if i < len(self._frames) and self._frames[i] == frame:
+            self._markers[i] = marker
+        else:
+            self._frames.insert(i, frame)
+            self._markers.insert(i, marker)
+        return marker
+    def delete_frame(self, frame):
+        i = bisect.bisect_left(self._frames, frame)
+        if i < len(self._frames) and self._frames[i] == frame:
+            del self._frames[i]
+            del self._markers[i]
+    def foreach_get(self, attr, seq):
+        if attr == "co":
+            seq[:] = [v for m in self._markers for v in m.co]
+        else:
+            seq[:] = [getattr(m, attr) for m in self._markers]
+    def foreach_set(self, attr, seq):
+        if attr == "co":
+            for i, m in enumerate(self._markers):
+                m.co = (seq[2*i], seq[2*i+1])
+        else:
+            for m, value in zip(self._markers, seq):
+                setattr(m, attr, type(getattr(m, attr))(value))
+
+
+class Track():
+    _pointer = [0]
+    def __init__(self, name):
+        self.name = name
+        self.markers = Markers()
+        self.select = False
+        self.hide = False
+        self.lock = False
+        self.frames_limit = 0
+        Track._pointer[0] += 1
+        self._p = Track._pointer[0]
+    def as_pointer(self):
+        return self._p
+
+
+class Tracks():
+    def __init__(self):
+        self._tracks = []
+        self._names = 0
+    def __len__(self):
+        return len(self._tracks)
+    def __iter__(self):
+        return iter(list(self._tracks))
+    def __getitem__(self, i):
+        return self._tracks[i]
+    def new(self, name="", frame=1):
+        # like Blender, names stay unique after tracks are deleted
+        names = set(track.name for track in self._tracks)
+        name = name or "Track"
+        while name in names:
+            self._names += 1
+            name = "Track.%03d" % self._names
+        track = Track(name)
+        track.markers.insert_frame(frame)
+        track.select = True
+        self._tracks.append(track)
+        return track
+    def remove_selected(self):
+        # what bpy.ops.clip.delete_track does, hidden tracks are kept even when selected
+        self._tracks = [track for track in self._tracks if track.hide or not track.select]
+
+
+class Clip():
+    def __init__(self, frame_start=1, frame_duration=100, size=(1920, 1080), name="clip"):
+        self.name = name
+        self.frame_start = frame_start
+        self.frame_duration = frame_duration
+        self.size = size
+        self.filepath = ""
+        self.source = 'SEQUENCE'
+        self.tracking = types.SimpleNamespace(tracks=Tracks())
+
+
+class Scene():
+    def __init__(self, frame_start=1, frame_end=100, name="Scene"):
+        self.name = name
+        self.frame_start = frame_start
+        self.frame_end = frame_end
+        self.frame_current = frame_start
+
+
+def _property(**kwargs):
+    # properties are plain class attributes holding the default value
+    if "default" in kwargs:
+        return kwargs["default"]
+    if "items" in kwargs:
+        return kwargs["items"][0][0]
+    return None
+
+
+def install():
+    """
+        register stand-in bpy, bpy_extras, bgl, blf and mathutils modules
+        return the bpy module
+    """
+    if "bpy" in sys.modules:
+        return sys.modules["bpy"]
+    bpy = types.ModuleType("bpy")
+    bpy.__path__ = []
+
+    class Base():
+        pass
+
+    bpy.types = types.ModuleType("bpy.types")
+    for name in ("Operator", "Panel", "PropertyGroup", "WindowManager", "SpaceClipEditor"):
+        setattr(bpy.types, name, type(name, (Base,), {}))
+    bpy.props = types.ModuleType("bpy.props")
+    for name in ("BoolProperty", "FloatProperty", "IntProperty", "EnumProperty",
+            "PointerProperty", "StringProperty", "CollectionProperty"):
+        setattr(bpy.props, name, _property)
+    bpy.utils = types.SimpleNamespace(
+        register_class=lambda cls: None,
+        unregister_class=lambda cls: None,
+        register_module=lambda name: None,
+        unregister_module=lambda name: None)
+    bpy.path = types.SimpleNamespace(abspath=lambda path: path)
+    bpy.app = types.SimpleNamespace(background=True)
+    bpy.data = types.SimpleNamespace(movieclips={}, scenes={}, screens=[])
+    bpy.ops = types.SimpleNamespace()
+    bpy.context = None
+
+    bgl = types.ModuleType("bgl")
+    for name in ("GL_LINE_STIPPLE", "GL_LINE", "GL_BLEND", "GL_ENABLE_BIT", "GL_LINE_STRIP", "GL_POLYGON"):
+        setattr(bgl, name, 0)
+    mathutils = types.ModuleType("mathutils")
+    mathutils.Vector = Vector
+
+    sys.modules["bpy"] = bpy
+    sys.modules["bpy.types"] = bpy.types
+    sys.modules["bpy.props"] = bpy.props
+    bpy_extras = types.ModuleType("bpy_extras")
+    bpy_extras.__path__ = []
+    bpy_extras.io_utils = types.ModuleType("bpy_extras.io_utils")
+    for name in ("ExportHelper", "ImportHelper"):
+        setattr(bpy_extras.io_utils, name, type(name, (), {}))
+
+    sys.modules["bgl"] = bgl
+    sys.modules["bpy_extras"] = bpy_extras
+    sys.modules["bpy_extras.io_utils"] = bpy_extras.io_utils
+    sys.modules["blf"] = types.ModuleType("blf")
+    sys.modules["mathutils"] = mathutils
+    return bpy
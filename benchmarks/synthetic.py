@@ -0,0 +1,184 @@
+"""
+    Synthetic clips and a stand-in detection / tracking backend for benchmarks
+"""
+import random
+
+import numpy as np
+
+import fake_bpy
+
+
+def make_clip(tracks=200, frames=500, motion=0.002, outliers=0.01, mute=0.01, seed=0):
+    """
+        clip with tracks moving along a global camera motion
+        tracks : number of tracks
+        frames : clip length
+        motion : mean per frame motion (normalized clip size)
+        outliers : probability for a marker to jump away from its path
+        mute : probability for a marker to be muted
+        return clip, scene
+    """
+    rnd = random.Random(seed)
+    clip = fake_bpy.Clip(1, frames)
+    scene = fake_bpy.Scene(1, frames)
+    pan = [(0.0, 0.0)]
+    for frame in range(frames):
+        x, y = pan[-1]
+        pan.append((x+motion*rnd.uniform(0.5, 1.5), y+motion*rnd.uniform(-0.5, 0.5)))
+    for i in range(tracks):
+        start = rnd.randint(1, frames)
+        end = min(frames, start+rnd.randint(1, frames))
+        track = clip.tracking.tracks.new(frame=start)
+        track.select = False
+        x0, y0 = rnd.random(), rnd.random()
+        jump = 0.0
+        for frame in range(start, end+1):
+            if rnd.random() < outliers:
+                jump += rnd.uniform(0.05, 0.2)
+            dx, dy = pan[frame-1]
+            marker = track.markers.insert_frame(frame, co=(x0+dx+jump, y0+dy))
+            marker.mute = rnd.random() < mute
+    return clip, scene
+
+
+def texture(width, height, blur=2, seed=0):
+    """
+        blurred noise in [0, 1], full of corners
+    """
+    noise = np.random.RandomState(seed).rand(height, width)
+    size = 2*blur+1
+    for axis in (0, 1):
+        c = np.cumsum(np.pad(noise, [(blur+1, blur) if a == axis else (0, 0) for a in (0, 1)], mode='edge'), axis=axis)
+        noise = (np.take(c, range(size, c.shape[axis]), axis=axis)-np.take(c, range(c.shape[axis]-size), axis=axis))/size
+    return (noise-noise.min())/(noise.max()-noise.min())
+
+
+class FakeBackend():
+    """
+        Stand-in for ClipEditorBackend
+        detect_features adds count random features, track_markers follows
+        the camera motion and loses tracks with probability loss per frame
+        frame_pixels renders a texture panning by motion per frame, in image_size pixels
+    """
+    def __init__(self, clip, scene, count=50, motion=0.002, loss=0.01, outliers=0.005, seed=0,
+            image_size=(480, 270)):
+        self.clip = clip
+        self.scene = scene
+        self.count = count
+        self.motion = motion
+        self.loss = loss
+        self.outliers = outliers
+        self.rnd = random.Random(seed)
+        self.seed = seed
+        self.image_size = image_size
+        self.world = None
+
+    def threaded_frames(self, clip):
+        # frame_pixels is plain NumPy, it can run on the frame cache prefetch thread
+        return True
+
+    def frame_pixels(self, clip, frame):
+        width, height = self.image_size
+        shift = self.motion*width*(frame-clip.frame_start)
+        if self.world is None:
+            pan = int(self.motion*width*clip.frame_duration)+2
+            self.world = texture(width+pan, height, seed=self.seed).astype(np.float32)
+        i = int(shift)
+        a = shift-i
+        # camera moving right: the image content moves left
+        return (1-a)*self.world[:, i:i+width]+a*self.world[:, i+1:i+width+1]
+
+    def select_all(self, action='DESELECT'):
+        # like clip operators, hidden tracks are left as they are
+        for track in self.clip.tracking.tracks:
+            if not track.hide:
+                track.select = action != 'DESELECT'
+
+    def detect_features(self, threshold=0.5, min_distance=0, margin=0, placement='FRAME'):
+        width, height = self.clip.size
+        mx, my = float(margin)/width, float(margin)/height
+        for i in range(self.count):
+            track = self.clip.tracking.tracks.new(frame=self.scene.frame_current)
+            track.markers[0].co = (self.rnd.uniform(mx, 1-mx), self.rnd.uniform(my, 1-my))
+            track.select = True
+
+    def delete_tracks(self, to_delete):
+        self.select_all(action='DESELECT')
+        for track in to_delete:
+            track.hide = False
+            track.select = True
+        self.clip.tracking.tracks.remove_selected()
+
+    def track_markers(self, backwards, invoke=False):
+        tracks = [track for track in self.clip.tracking.tracks
+            if track.select and not (track.hide or track.lock)]
+        limits = [track.frames_limit for track in tracks if track.frames_limit > 0]
+        step = -1 if backwards else 1
+        clip_start = self.clip.frame_start
+        clip_end = self.clip.frame_start+self.clip.frame_duration-1
+        start = self.scene.frame_current
+        if len(limits) > 0:
+            end = start+min(limits)*step
+        else:
+            end = clip_end if step > 0 else clip_start
+        end = max(clip_start, min(clip_end, end))
+        last = start
+        for track in tracks:
+            marker = track.markers.find_frame(start)
+            if marker is None or marker.mute:
+                continue
+            x, y = marker.co
+            for frame in range(start+step, end+step, step):
+                if self.rnd.random() < self.loss:
+                    break
+                x += step*self.motion*self.rnd.uniform(0.5, 1.5)
+                y += step*self.motion*self.rnd.uniform(-0.5, 0.5)
+                if self.rnd.random() < self.outliers:
+                    x += self.rnd.uniform(0.05, 0.2)
+                track.markers.insert_frame(frame, co=(x, y))
+                if (frame-last)*step > 0:
+                    last = frame
+        self.scene.frame_current = last
+        return {'FINISHED'}
+
+
+def settings(**overrides):
+    """
+        add-on default settings with overrides
+    """
+    import autotracker
+    return autotracker.SettingsOverride(autotracker.AutotrackerSettings(), **overrides)
+
+
+def install_clip_editor(clip, scene, **backend_args):
+    """
+        register clip and scene in the stand-in bpy.data with a screen holding a clip editor,
+        bpy.ops.clip operators run a FakeBackend on the clip of the context override,
+        so ClipEditorBackend and ForkedClipSetup run on synthetic clips
+        backend_args : FakeBackend arguments
+        return the FakeBackend
+    """
+    import bpy
+    import types
+    backend = FakeBackend(clip, scene, **backend_args)
+    bpy.data.movieclips[clip.name] = clip
+    bpy.data.scenes[scene.name] = scene
+    area = types.SimpleNamespace(type='CLIP_EDITOR', spaces=types.SimpleNamespace(
+        active=types.SimpleNamespace(clip=clip)), regions=[types.SimpleNamespace(type='WINDOW')])
+    bpy.data.screens[:] = [types.SimpleNamespace(areas=[area])]
+    if bpy.context is None:
+        bpy.context = types.SimpleNamespace(window=None, scene=scene)
+
+    def track_markers(override, mode='EXEC_DEFAULT', backwards=False, sequence=True):
+        return backend.track_markers(backwards)
+
+    def delete_track(override):
+        override['edit_movieclip'].tracking.tracks.remove_selected()
+        return {'FINISHED'}
+
+    bpy.ops.clip = types.SimpleNamespace(
+        select_all=lambda override, action='DESELECT': backend.select_all(action),
+        detect_features=lambda override, **kwargs: backend.detect_features(**kwargs),
+        delete_track=delete_track,
+        track_markers=track_markers)
+    return backend
@@ -0,0 +1,402 @@
+"""
+    Checks of the autotracker add-on outside of Blender, with the stand-in bpy of benchmarks/
+
+    python -m pytest tests
+"""
+import collections
+import contextlib
+import io
+import os
+import struct
+import sys
+import zlib
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fake_bpy
+fake_bpy.install()
+
+import autotracker
+import synthetic
+
+
+def quiet(call, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return call(*args, **kwargs)
+
+
+def brute_force_knn(points, k):
+    d2 = ((points[:, np.newaxis]-points[np.newaxis])**2).sum(axis=2)
+    np.fill_diagonal(d2, np.inf)
+    return np.sort(d2, axis=1)[:, :k]
+
+
+def test_knn_indices_matches_brute_force():
+    rnd = np.random.RandomState(0)
+    cases = [
+        rnd.rand(1000, 2),
+        # line, horizon band, two clusters, cluster in uniform points
+        np.stack([rnd.rand(1000), np.full(1000, 0.5)], axis=1),
+        np.stack([rnd.rand(1000), 0.5+0.01*rnd.rand(1000)], axis=1),
+        np.concatenate([0.001*rnd.rand(500, 2), 0.9+0.001*rnd.rand(500, 2)]),
+        np.concatenate([rnd.rand(300, 2), 0.5+0.0001*rnd.rand(700, 2)]),
+        rnd.rand(5, 2),
+        ]
+    for points in cases:
+        points = points.astype(np.float32)
+        for k in (1, 8):
+            found = autotracker.knn_indices(points, k)
+            m = min(k, len(points)-1)
+            assert (found[:, :m] >= 0).all()
+            assert (found[:, m:] == -1).all()
+            assert (found[:, :m] != np.arange(len(points))[:, np.newaxis]).all()
+            d2 = np.sort(((points[found[:, :m]]-points[:, np.newaxis])**2).sum(axis=2), axis=1)
+            assert np.allclose(d2, brute_force_knn(points, m))
+
+
+def write_png(path, pixels, color, depth=8, palette=None):
+    # every row filter type, so the unfiltering of each one is checked
+    height, width = pixels.shape[:2]
+    data = pixels.astype(">u2" if depth == 16 else np.uint8).reshape(height, width, -1)
+    data = data.view(np.uint8).astype(np.int16)
+    pad = np.zeros((height+1, width+1, data.shape[2]), dtype=np.int16)
+    pad[1:, 1:] = data
+    a, b, c = pad[1:, :-1], pad[:-1, 1:], pad[:-1, :-1]
+    p = a+b-c
+    pa, pb, pc = np.abs(p-a), np.abs(p-b), np.abs(p-c)
+    paeth = np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c))
+    predictions = [np.zeros_like(a), a, b, (a+b) >> 1, paeth]
+    rows = []
+    for y in range(height):
+        rows.append(bytes([y % 5])+((data[y]-predictions[y % 5][y]) & 255).astype(np.uint8).tobytes())
+    chunk = lambda kind, body: (struct.pack(">I", len(body))+kind+body
+        +struct.pack(">I", zlib.crc32(kind+body)))
+    header = struct.pack(">IIBBBBB", width, height, depth, color, 0, 0, 0)
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n"+chunk(b"IHDR", header))
+        if palette is not None:
+            f.write(chunk(b"PLTE", palette.tobytes()))
+        f.write(chunk(b"IDAT", zlib.compress(b"".join(rows)))+chunk(b"IEND", b""))
+
+
+def test_read_png_and_pnm(tmp_path):
+    rnd = np.random.RandomState(0)
+    rgb = rnd.randint(0, 256, (23, 31, 3))
+    gray16 = rnd.randint(0, 65536, (17, 9, 1))
+    palette = rnd.randint(0, 256, (16, 3)).astype(np.uint8)
+    index = rnd.randint(0, 16, (11, 13, 1))
+    cases = [
+        (rgb, 2, 8, None, rgb/255.0),
+        (rnd.randint(0, 256, (12, 7, 4)), 6, 8, None, None),
+        (rnd.randint(0, 256, (12, 7, 2)), 4, 8, None, None),
+        (gray16, 0, 16, None, gray16/65535.0),
+        (index, 3, 8, palette, palette[index[:, :, 0]]/255.0),
+        ]
+    for i, (pixels, color, depth, pal, expected) in enumerate(cases):
+        path = str(tmp_path/("image_%d.png" % (i)))
+        write_png(path, pixels, color, depth, pal)
+        if expected is None:
+            expected = pixels/255.0
+        assert np.allclose(autotracker.read_png(path), expected, atol=1e-6)
+    
+    path = str(tmp_path/"image.ppm")
+    with open(path, "wb") as f:
+        f.write(b"P6\n# comment\n31 23\n255\n"+rgb.astype(np.uint8).tobytes())
+    assert np.allclose(autotracker.read_pnm(path), rgb/255.0, atol=1e-6)
+
+
+def test_image_sequence_reads_frames_without_bpy(tmp_path):
+    rnd = np.random.RandomState(1)
+    frames = [rnd.randint(0, 256, (10, 12, 3)) for i in range(3)]
+    for i, pixels in enumerate(frames):
+        write_png(str(tmp_path/("shot_%04d.png" % (i+5))), pixels, 2)
+    clip = fake_bpy.Clip(frame_start=1, frame_duration=3)
+    clip.filepath = str(tmp_path/"shot_0005.png")
+    clip.frame_offset = 0
+    sequence = autotracker.ImageSequence(clip)
+    assert sequence.threaded
+    for i, pixels in enumerate(frames):
+        gray = autotracker.luminance(pixels/255.0)[::-1]
+        assert np.allclose(sequence.read(1+i), gray, atol=1e-5)
+    assert sequence.read(4) is None
+
+
+def test_frame_caches_do_not_share_files(tmp_path):
+    caches = [autotracker.FrameCache(lambda frame, i=i: np.full((4, 4), i, dtype=np.float32),
+        mmap_dir=str(tmp_path)) for i in range(2)]
+    for i, cache in enumerate(caches):
+        assert (cache.get(1) == i).all()
+    assert caches[0].mmap_dir != caches[1].mmap_dir
+    assert (caches[0].get(1) == 0).all()
+    for cache in caches:
+        cache.close()
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_klt_stops_at_clip_end():
+    # scene range goes past the clip, frames after it can not be read
+    clip, scene = synthetic.make_clip(0, 40, seed=0)
+    scene.frame_end = 250
+    backend = synthetic.FakeBackend(clip, scene, seed=0)
+    frame_pixels = backend.frame_pixels
+    clip_end = clip.frame_start+clip.frame_duration-1
+    backend.frame_pixels = lambda clip, frame: frame_pixels(clip, frame) if clip.frame_start <= frame <= clip_end else None
+    quiet(autotracker.batch_autotrack, clip, synthetic.settings(tracker='KLT', detector='GRID'), scene, backend)
+    assert scene.frame_current == clip_end
+    assert len(clip.tracking.tracks) > 0
+    assert max(marker.frame for track in clip.tracking.tracks for marker in track.markers) <= clip_end
+
+
+def test_klt_tracks_markers_near_borders():
+    clip, scene = synthetic.make_clip(0, 10, seed=0)
+    width, height = 480, 270
+    backend = synthetic.FakeBackend(clip, scene, image_size=(width, height), motion=0.002)
+    levels = autotracker.pyramid_levels((height, width))
+    before = autotracker.build_pyramid(backend.frame_pixels(clip, 1), levels)
+    after = autotracker.build_pyramid(backend.frame_pixels(clip, 2), levels)
+    ys = np.arange(8, height-8, dtype=np.float32)
+    points = np.stack([np.full_like(ys, width/2), ys], axis=1)
+    tracked, ok = autotracker.klt_track(before, after, points)
+    assert ok.all()
+    assert np.abs(tracked[:, 0]-(points[:, 0]-0.002*width)).max() < 0.05
+
+
+def test_deleted_tracks_are_removed_even_hidden():
+    clip, scene = synthetic.make_clip(10, 50, seed=0)
+    synthetic.install_clip_editor(clip, scene, seed=0)
+    tracks = list(clip.tracking.tracks)
+    # like Blender, delete_track leaves hidden tracks in place
+    tracks[0].hide = True
+    tracks[0].select = True
+    autotracker.bpy.ops.clip.delete_track({'edit_movieclip': clip})
+    assert tracks[0] in list(clip.tracking.tracks)
+    
+    tracks[0].hide = False
+    engine = autotracker.AutotrackEngine(clip, synthetic.settings(), scene, autotracker.ClipEditorBackend.from_clip(clip, scene))
+    engine.delete_tracks(tracks[:3])
+    assert all(track.hide for track in tracks[:3])
+    engine.flush_deleted()
+    left = list(clip.tracking.tracks)
+    assert not any(track in left for track in tracks[:3])
+    assert all(track in left for track in tracks[3:])
+    quiet(engine.finish)
+
+
+def test_user_hidden_tracks_are_kept_hidden():
+    # filtered every cycle, or once by cleanup_shot when autotracking ends
+    for cycle_filter in (True, False):
+        clip, scene = synthetic.make_clip(20, 200, outliers=0.05, seed=0)
+        hidden = list(clip.tracking.tracks)[:5]+[clip.tracking.tracks.new(frame=50)]
+        markers = [len(track.markers) for track in hidden]
+        for track in hidden:
+            track.hide = True
+        backend = synthetic.FakeBackend(clip, scene, seed=0)
+        settings = synthetic.settings(small_tracks=20, cycle_filter=cycle_filter)
+        quiet(autotracker.batch_autotrack, clip, settings, scene, backend)
+        left = list(clip.tracking.tracks)
+        assert all(track in left and track.hide for track in hidden)
+        assert [len(track.markers) for track in hidden] == markers
+        assert sum(track.hide for track in left) == len(hidden)
+
+
+def test_max_active_limits_tracked_tracks():
+    clip, scene = synthetic.make_clip(0, 200, seed=0)
+    backend = synthetic.FakeBackend(clip, scene, count=100, seed=0)
+    track_markers = backend.track_markers
+    tracked = []
+    def count_tracked(backwards, invoke=False):
+        tracked.append(sum(1 for track in clip.tracking.tracks if track.select and not (track.hide or track.lock)
+            and track.markers.find_frame(scene.frame_current) is not None))
+        return track_markers(backwards, invoke)
+    backend.track_markers = count_tracked
+    quiet(autotracker.batch_autotrack, clip, synthetic.settings(max_active=30), scene, backend)
+    assert scene.frame_current == scene.frame_end
+    assert len(tracked) > 5
+    assert max(tracked) <= 30
+    assert max(tracked) > 20
+
+
+def test_resume_continues_interrupted_run(tmp_path):
+    clip, scene = synthetic.make_clip(20, 300, seed=0)
+    user = clip.tracking.tracks[0]
+    user.lock = True
+    settings = synthetic.settings(small_tracks=20, checkpoint_every=3, checkpoint_dir=str(tmp_path))
+    backend = synthetic.FakeBackend(clip, scene, seed=0, outliers=0.01)
+    track_markers = backend.track_markers
+    def interrupt(backwards, invoke=False):
+        if scene.frame_current >= 150:
+            raise KeyboardInterrupt
+        return track_markers(backwards, invoke)
+    backend.track_markers = interrupt
+    try:
+        quiet(autotracker.batch_autotrack, clip, settings, scene, backend)
+    except KeyboardInterrupt:
+        pass
+    
+    backend.track_markers = track_markers
+    quiet(autotracker.batch_autotrack, clip, settings, scene, backend, resume=True)
+    assert scene.frame_current == scene.frame_end
+    tracks = list(clip.tracking.tracks)
+    assert user in tracks and user.lock
+    assert len(set(track.name for track in tracks)) == len(tracks)
+    assert not any(track.hide for track in tracks)
+    # finished runs are not resumed
+    engine = autotracker.AutotrackEngine(clip, settings, scene, backend)
+    assert not engine.resume(str(tmp_path))
+    quiet(engine.finish)
+
+
+def test_parallel_workers_do_not_share_files(tmp_path):
+    clip, scene = synthetic.make_clip(0, 120, seed=0)
+    clip.name = "parallel_files"
+    synthetic.install_clip_editor(clip, scene, seed=0)
+    checkpoint_dir = tmp_path/"checkpoint"
+    settings = synthetic.settings(checkpoint_every=2, checkpoint_dir=str(checkpoint_dir),
+        metrics_path=str(tmp_path/"metrics.jsonl"))
+    created = quiet(autotracker.parallel_autotrack, clip, settings, scene, workers=3)
+    assert len(created) > 0
+    assert not checkpoint_dir.exists()
+    metrics = sorted(path.name for path in tmp_path.iterdir() if path.name.startswith("metrics"))
+    assert len(metrics) == 3 and "metrics.jsonl" not in metrics
+
+
+def test_split_frame_range_covers_range_with_overlap():
+    segments = autotracker.split_frame_range(1, 301, 3, 10)
+    assert segments[0][0] == 1 and segments[-1][1] == 301
+    for (start, end), (next_start, next_end) in zip(segments, segments[1:]):
+        assert next_start == end-10
+    # segments shorter than twice the overlap are merged
+    assert autotracker.split_frame_range(1, 31, 8, 10) == [(1, 31)]
+
+
+def line(start, end, x, y, dx=0.01):
+    return [(frame, x+dx*(frame-start), y, False) for frame in range(start, end+1)]
+
+
+def test_stitch_segments_continues_tracks_one_to_one():
+    first = [line(1, 20, 0.1, 0.5), line(1, 20, 0.5, 0.5)]
+    second = [
+        # continues first[0] on frames 16..20, then goes on
+        line(16, 40, 0.25, 0.5),
+        # same path, first[0] is already continued
+        line(16, 40, 0.25, 0.5),
+        # near first[1] but further than threshold
+        line(16, 40, 0.7, 0.5),
+        ]
+    merged = autotracker.stitch_segments([first, second], 0.02)
+    assert len(merged) == 4
+    assert [m[0] for m in merged[0]] == list(range(1, 41))
+    # markers of the earlier segment are kept on shared frames
+    assert merged[0][:20] == first[0]
+    assert merged[1] == first[1]
+    assert sorted(merged[2:]) == sorted([second[1], second[2]])
+
+
+def test_join_at_frame_pairs_nearest_first_one_to_one():
+    # still markers, positions on the join frame 50
+    a, b, c = line(50, 60, 0.500, 0.5, 0), line(50, 60, 0.506, 0.5, 0), line(50, 60, 0.9, 0.9, 0)
+    p, q, r = line(40, 50, 0.504, 0.5, 0), line(40, 50, 0.511, 0.5, 0), line(40, 50, 0.1, 0.1, 0)
+    # b-p (0.002) is joined first, a row order greedy match would join a-p (0.004) and b-q (0.005),
+    # q is then too far from a (0.011)
+    merged = autotracker.join_at_frame([a, b, c], [p, q, r], 50, 0.01)
+    assert merged == [a, p[:-1]+b, c, q, r]
+
+
+def test_track_arrays_save_load_round_trip(tmp_path):
+    clip, scene = synthetic.make_clip(20, 60, seed=0)
+    tracks = list(clip.tracking.tracks)
+    tracks[3].hide = True
+    tracks[5].markers.find_frame(tracks[5].markers[0].frame).mute = True
+    path = str(tmp_path/"tracks.npz")
+    autotracker.TrackArrays.from_tracks(tracks).save(path)
+    
+    other, other_scene = synthetic.make_clip(0, 60, seed=1)
+    created = autotracker.TrackArrays.load(path).to_tracks(other)
+    assert len(created) == len(tracks)
+    for track, copy in zip(tracks, created):
+        assert copy.name == track.name
+        assert copy.hide == track.hide
+        assert [m.frame for m in copy.markers] == [m.frame for m in track.markers]
+        assert [m.mute for m in copy.markers] == [m.mute for m in track.markers]
+        co = np.array([tuple(m.co) for m in track.markers], dtype=np.float32)
+        assert np.array_equal(np.array([tuple(m.co) for m in copy.markers], dtype=np.float32), co)
+
+
+def test_compact_trims_muted_tails_keeping_end_markers():
+    clip, scene = synthetic.make_clip(0, 60, seed=0)
+    tracks = clip.tracking.tracks
+    trimmed = tracks.new(frame=1)
+    for frame in range(2, 21):
+        trimmed.markers.insert_frame(frame)
+    for frame in (1, 2, 3, 17, 18, 19, 20):
+        trimmed.markers.find_frame(frame).mute = True
+    single = tracks.new(frame=30)
+    single.markers.insert_frame(31).mute = True
+    hidden = tracks.new(frame=40)
+    hidden.hide = True
+    engine = autotracker.AutotrackEngine(clip, synthetic.settings(small_tracks=5), scene,
+        synthetic.FakeBackend(clip, scene))
+    removed = quiet(engine.compact_tracks, list(tracks))
+    engine.flush_deleted()
+    # frames 1, 2, 18, 19, 20 and both markers of the single track
+    assert removed[:2] == (1, 7)
+    # muted markers next to the first and last enabled ones are kept, they end the track
+    assert [m.frame for m in trimmed.markers] == list(range(3, 18))
+    assert trimmed.markers[0].mute and trimmed.markers[-1].mute
+    assert not any(m.mute for m in trimmed.markers[1:-1])
+    assert list(tracks) == [trimmed, hidden]
+    quiet(engine.finish)
+
+
+def test_frames_are_only_read_by_built_in_stages(tmp_path, monkeypatch):
+    write_png(str(tmp_path/"shot_0001.png"), np.zeros((10, 12, 3)), 2)
+    clip, scene = synthetic.make_clip(5, 1, seed=0)
+    clip.filepath = str(tmp_path/"shot_0001.png")
+    clip.frame_offset = 0
+    # the first frame header tells if frames can be decoded on the prefetch thread
+    def no_decode(path):
+        raise AssertionError("decoded %s" % (path))
+    monkeypatch.setattr(autotracker, "read_png", no_decode)
+    assert autotracker.ImageSequence(clip).threaded
+    
+    backend = autotracker.ClipEditorBackend()
+    engine = autotracker.AutotrackEngine(clip, synthetic.settings(), scene, backend)
+    quiet(engine.cleanup_shot)
+    quiet(engine.finish)
+    assert engine.frames is None and backend.sequences == {}
+
+
+def test_frame_cache_keeps_8_bit_frames():
+    clip, scene = synthetic.make_clip(0, 20, seed=0)
+    backend = synthetic.FakeBackend(clip, scene, seed=0)
+    engine = autotracker.AutotrackEngine(clip, synthetic.settings(frame_cache_uint8=True), scene, backend)
+    pixels = engine.get_frame(3)
+    assert engine.frames.dtype == np.uint8
+    assert all(cached.dtype == np.uint8 for cached in engine.frames.frames.values())
+    assert np.abs(pixels-backend.frame_pixels(clip, 3)).max() <= 0.5/255+1e-6
+    quiet(engine.finish)
+
+
+def test_downscale_is_block_mean():
+    pixels = np.random.RandomState(0).rand(37, 53).astype(np.float32)
+    for factor in (2, 4, 8):
+        h, w = 37//factor, 53//factor
+        expected = pixels[:h*factor, :w*factor].reshape(h, factor, w, factor).mean(axis=(1, 3))
+        assert np.allclose(autotracker.downscale(pixels, factor), expected, atol=1e-6)
+
+
+def test_refine_reads_each_keyframe_once():
+    clip, scene = synthetic.make_clip(0, 40, seed=0)
+    backend = synthetic.FakeBackend(clip, scene, seed=0, image_size=(320, 240))
+    reads = []
+    frame_pixels = backend.frame_pixels
+    backend.frame_pixels = lambda clip, frame: reads.append(frame) or frame_pixels(clip, frame)
+    settings = synthetic.settings(tracker='KLT', detector='GRID', proxy_scale='4', refine_every=1)
+    engine = quiet(autotracker.batch_autotrack, clip, settings, scene, backend)
+    assert engine.refine_pyramids == {}
+    # once for the proxy frame cache, once for refine, where a keyframe ends one window and starts the next
+    counts = collections.Counter(reads)
+    assert max(counts.values()) == 2 and sum(1 for n in counts.values() if n == 2) > 2